@@ -0,0 +1,66 @@
+"""Compare requests/sec of the sync (threadpool) and async database modes
+
+Starts one uvicorn server per mode against the database configured in .env
+and hammers read endpoints with a fixed concurrency:
+
+    python -m benchmarks.db_mode --requests 5000 --concurrency 100
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from .server import run_server
+
+ENDPOINTS = ["/offers/", "/offers/1", "/users/?limit=20"]
+
+
+async def run_load(base_url: str, total: int, concurrency: int) -> float:
+    """Send `total` GET requests with `concurrency` workers and return requests/sec"""
+    counter = iter(range(total))
+    errors = 0
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        for i in counter:
+            response = await client.get(ENDPOINTS[i % len(ENDPOINTS)])
+            if response.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    if errors:
+        print(f"  {errors} non-200 responses")
+    return total / elapsed
+
+
+def bench_mode(async_mode: bool, port: int, total: int, concurrency: int) -> float:
+    env = {"DATABASE_ASYNC": "true" if async_mode else "false"}
+    with run_server(port, env) as base_url:
+        # Warm up pools and caches before measuring
+        asyncio.run(run_load(base_url, min(total, 200), concurrency))
+        return asyncio.run(run_load(base_url, total, concurrency))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = {}
+    for async_mode in (False, True):
+        label = "async" if async_mode else "sync"
+        results[label] = bench_mode(async_mode, args.port, args.requests, args.concurrency)
+        print(f"{label:>5}: {results[label]:8.1f} req/s")
+    print(f"speedup: {results['async'] / results['sync']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""Reproducible load benchmark of the main user flows
+
+Boots main:app against throwaway stand-ins (a temporary SQLite database and
+an in-process fakeredis server) or against the Postgres/Redis configured in
+.env, seeds synthetic users, then has virtual users log in and run a
+weighted mix of requests (/auth/me, /offers/, subscribeTo...) for a fixed
+duration. Requests go either straight to the ASGI app in this process or
+over HTTP to uvicorn.
+
+The report (throughput, p50/p95/p99 and SQL queries per request, overall
+and per operation) is printed as JSON, stable enough to diff between
+commits:
+
+    python -m benchmarks.load --users 10000 --concurrency 32 --duration 20 --output before.json
+    python -m benchmarks.load --transport http --workers 1 --backend env
+
+Logins cost one bcrypt verification each at BCRYPT_ROUNDS; set it lower
+(e.g. BCRYPT_ROUNDS=4) to keep them from dominating a run on a small
+machine. Queries per request are counted per operation in-process, and
+overall from /metrics over HTTP with a single worker.
+"""
@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from . import __doc__ as DESCRIPTION
+from .environment import BACKENDS, prepare
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, queries: Optional[int], duration: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / duration, 1),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        "queries_per_request": round(queries / len(ordered), 2) if queries is not None and ordered else None,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout
+        return commit + ("-dirty" if dirty.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def count_queries_by_operation():
+    """Attach engine listeners charging each statement to the operation being sent"""
+    from sqlalchemy import event
+
+    from src import database
+    from .workload import current_operation
+
+    counts: Dict[str, int] = {}
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        operation = current_operation.get()
+        if operation is not None:
+            counts[operation] = counts.get(operation, 0) + 1
+
+    engines = [database.engine, *database.replica_engines]
+    engines += [e.sync_engine for e in [database.async_engine, *database.async_replica_engines] if e is not None]
+    for target in engines:
+        event.listen(target, "before_cursor_execute", on_execute)
+    return counts
+
+
+async def scraped_query_count(base_url: str) -> int:
+    """Statements run so far by the worker answering, from its /metrics"""
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        text = (await client.get("/metrics")).text
+    return int(sum(
+        float(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+        if line.startswith("db_query_duration_seconds_count")
+    ))
+
+
+async def run_in_process(args, mix):
+    from main import app
+    from .workload import run_workload
+
+    counts = count_queries_by_operation()
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        start = time.perf_counter()
+        stats = await run_workload(
+            lambda: httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120),
+            args.users, args.concurrency, args.duration, mix, args.seed,
+        )
+        elapsed = time.perf_counter() - start
+    for name, operation_stats in stats.items():
+        operation_stats.queries = counts.get(name, 0)
+    return stats, elapsed, sum(counts.values())
+
+
+def run_over_http(args, mix):
+    from ..server import run_server
+    from .workload import run_workload
+
+    with run_server(args.port, workers=args.workers) as base_url:
+        # /metrics is per worker: the count is exact with a single one
+        queries_before = asyncio.run(scraped_query_count(base_url)) if args.workers == 1 else None
+        start = time.perf_counter()
+        stats = asyncio.run(run_workload(
+            lambda: httpx.AsyncClient(base_url=base_url, timeout=120),
+            args.users, args.concurrency, args.duration, mix, args.seed,
+        ))
+        elapsed = time.perf_counter() - start
+        queries = asyncio.run(scraped_query_count(base_url)) - queries_before if queries_before is not None else None
+    for operation_stats in stats.values():
+        operation_stats.queries = None
+    return stats, elapsed, queries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load", description=DESCRIPTION,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--backend", choices=BACKENDS, default="local",
+                        help="local: temporary SQLite + fakeredis; env: databases from .env")
+    parser.add_argument("--transport", choices=("asgi", "http"), default="asgi")
+    parser.add_argument("--database-async", action="store_true", help="run with DATABASE_ASYNC=true")
+    parser.add_argument("--users", type=int, default=10000, help="synthetic users to seed")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--mix", default="", help='operation weights, e.g. "me=40,offers=20,subscribe=10"')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (http transport)")
+    parser.add_argument("--port", type=int, default=8769)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    with prepare(args.backend, args.database_async):
+        from .seed import seed_users
+        from .workload import DEFAULT_MIX, parse_mix
+
+        mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+        seed_start = time.perf_counter()
+        inserted = seed_users(args.users)
+        print(f"Seeded {inserted} users in {time.perf_counter() - seed_start:.1f}s", file=sys.stderr)
+
+        if args.transport == "asgi":
+            stats, elapsed, queries = asyncio.run(run_in_process(args, mix))
+        else:
+            stats, elapsed, queries = run_over_http(args, mix)
+
+    all_latencies = [latency for operation_stats in stats.values() for latency in operation_stats.latencies]
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "backend": args.backend,
+            "transport": args.transport,
+            "database_async": args.database_async,
+            "workers": args.workers if args.transport == "http" else None,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "mix": mix,
+            "seed": args.seed,
+        },
+        "total": summarize(all_latencies, sum(s.errors for s in stats.values()), queries, elapsed),
+        "operations": {
+            name: {
+                **summarize(operation_stats.latencies, operation_stats.errors, operation_stats.queries, elapsed),
+                "statuses": {str(code): count for code, count in sorted(operation_stats.statuses.items())},
+            }
+            for name, operation_stats in sorted(stats.items())
+        },
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
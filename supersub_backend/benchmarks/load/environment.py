@@ -0,0 +1,44 @@
+"""Database and Redis the benchmarked app runs against
+
+Must run before anything from src is imported: the app reads its
+configuration from the environment at import time.
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+BACKENDS = ("local", "env")
+
+
+@contextmanager
+def prepare(backend: str, database_async: bool) -> Iterator[None]:
+    """Point the app at the stand-ins ("local") or keep the .env configuration ("env")"""
+    os.environ["DATABASE_ASYNC"] = "true" if database_async else "false"
+    if backend == "env":
+        yield
+        return
+
+    from fakeredis import TcpFakeServer
+
+    with tempfile.TemporaryDirectory(prefix="supersub-bench-") as directory:
+        path = os.path.join(directory, "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+        os.environ["DATABASE_REPLICA_URLS"] = ""
+        os.environ["ASYNC_DATABASE_REPLICA_URLS"] = ""
+
+        # A real TCP server, so that uvicorn subprocesses can reach it too
+        server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        host, port = server.server_address[:2]
+        os.environ["REDIS_HOST"] = host
+        os.environ["REDIS_PORT"] = str(port)
+        os.environ["REDIS_DB"] = "0"
+        try:
+            yield
+        finally:
+            server.shutdown()
+            server.server_close()
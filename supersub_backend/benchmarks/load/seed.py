@@ -0,0 +1,67 @@
+"""Synthetic users, inserted in bulk
+
+Every seeded user shares one password hash (bcrypt once instead of once per
+user) and gets a deterministic current/previous offer, so two runs with the
+same arguments start from the same data.
+"""
+import random
+from typing import Iterator, List
+
+from sqlalchemy import func, insert
+from sqlmodel import Session, select
+
+from src.auth.hashing import pwd_context
+from src.database import create_db_and_tables, engine
+from src.models.offers import Offers
+from src.models.users import GenderType, Users
+
+EMAIL_PREFIX = "bench-user-"
+PASSWORD = "bench-password"
+SEED_BATCH_SIZE = 5000
+GENDERS = list(GenderType)
+
+
+def email(index: int) -> str:
+    return f"{EMAIL_PREFIX}{index}@example.com"
+
+
+def _rows(start: int, count: int, password_hash: str, offer_ids: List[int]) -> Iterator[dict]:
+    generator = random.Random(start)
+    for index in range(start, count):
+        # A quarter without offer, a fifth of the others with a previous one
+        offer_id = generator.choice(offer_ids) if offer_ids and index % 4 else None
+        previous_offer_id = generator.choice(offer_ids) if offer_id and index % 5 == 0 else None
+        yield {
+            "email": email(index),
+            "firstname": "Bench",
+            "lastname": f"User{index}",
+            "age": 18 + index % 60,
+            "gender": GENDERS[index % len(GENDERS)],
+            "password": password_hash,
+            "offer_id": offer_id,
+            "previous_offer_id": previous_offer_id,
+        }
+
+
+def seed_users(count: int) -> int:
+    """Create the schema and make sure users 0..count-1 exist; returns the number inserted"""
+    create_db_and_tables()
+    with Session(engine) as session:
+        existing = session.exec(
+            select(func.count()).select_from(Users).where(Users.email.startswith(EMAIL_PREFIX))
+        ).one()
+        offer_ids = list(session.exec(select(Offers.id).order_by(Offers.id)).all())
+    if existing >= count:
+        return 0
+
+    password_hash = pwd_context.hash(PASSWORD)
+    batch: List[dict] = []
+    with engine.begin() as connection:
+        for row in _rows(existing, count, password_hash, offer_ids):
+            batch.append(row)
+            if len(batch) == SEED_BATCH_SIZE:
+                connection.execute(insert(Users), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(Users), batch)
+    return count - existing
@@ -0,0 +1,115 @@
+"""Virtual users running a weighted mix of operations"""
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from .seed import PASSWORD, email
+
+# Relative weights; login is also run once by every virtual user at start
+DEFAULT_MIX = {
+    "me": 40,
+    "offers": 20,
+    "offer": 10,
+    "subscribe": 10,
+    "unsubscribe": 5,
+    "users_page": 10,
+    "login": 5,
+}
+
+# Operation of the request being sent, for per-operation query counts (in-process only)
+current_operation: ContextVar[Optional[str]] = ContextVar("current_operation", default=None)
+
+
+@dataclass
+class OperationStats:
+    latencies: List[float] = field(default_factory=list)  # Seconds
+    statuses: Dict[int, int] = field(default_factory=dict)
+    errors: int = 0  # 5xx and transport errors
+    queries: Optional[int] = 0  # None when not measured per operation
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """"me=40,offers=20" -> {"me": 40, "offers": 20}"""
+    mix = {}
+    for part in filter(None, (part.strip() for part in text.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation {name!r}, expected one of {', '.join(DEFAULT_MIX)}")
+        mix[name] = int(weight)
+    return mix
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, index: int, offer_ids: List[int], seed: int):
+        self.client = client
+        self.index = index
+        self.offer_ids = offer_ids
+        self.random = random.Random(seed)
+        self.operations: Dict[str, Callable[[], Awaitable[httpx.Response]]] = {
+            "me": lambda: self.client.get("/auth/me"),
+            "offers": lambda: self.client.get("/offers/"),
+            "offer": lambda: self.client.get(f"/offers/{self.random.choice(self.offer_ids)}"),
+            "subscribe": lambda: self.client.post(
+                "/subscription/subscribeTo", json={"offer_id": self.random.choice(self.offer_ids)}
+            ),
+            "unsubscribe": lambda: self.client.post(
+                "/subscription/unsubscribeTo", json={"offer_id": self.random.choice(self.offer_ids)}
+            ),
+            "users_page": lambda: self.client.get("/users/page", params={"limit": 20}),
+            "login": lambda: self.client.post("/auth/login", json={"email": email(self.index), "password": PASSWORD}),
+        }
+
+    async def run_operation(self, name: str, stats: Dict[str, OperationStats]) -> None:
+        operation_stats = stats.setdefault(name, OperationStats())
+        token = current_operation.set(name)
+        start = time.perf_counter()
+        try:
+            response = await self.operations[name]()
+        except httpx.TransportError:
+            operation_stats.errors += 1
+            return
+        finally:
+            operation_stats.latencies.append(time.perf_counter() - start)
+            current_operation.reset(token)
+        operation_stats.statuses[response.status_code] = operation_stats.statuses.get(response.status_code, 0) + 1
+        if response.status_code >= 500:
+            operation_stats.errors += 1
+
+    async def run(self, mix: Dict[str, int], deadline: float, stats: Dict[str, OperationStats]) -> None:
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        await self.run_operation("login", stats)
+        while time.perf_counter() < deadline:
+            await self.run_operation(self.random.choices(names, weights)[0], stats)
+
+
+async def run_workload(
+    make_client: Callable[[], httpx.AsyncClient],
+    users: int,
+    concurrency: int,
+    duration: float,
+    mix: Dict[str, int],
+    seed: int
+) -> Dict[str, OperationStats]:
+    """Run `concurrency` virtual users, logged in as distinct seeded users, for `duration` seconds"""
+    async with make_client() as client:
+        offer_ids = [offer["id"] for offer in (await client.get("/offers/")).json()]
+    generator = random.Random(seed)
+    indexes = generator.sample(range(users), min(concurrency, users))
+    stats: Dict[str, OperationStats] = {}
+    deadline = time.perf_counter() + duration
+    clients = [make_client() for _ in indexes]
+    try:
+        await asyncio.gather(*(
+            VirtualUser(client, index, offer_ids, seed + index).run(mix, deadline, stats)
+            for client, index in zip(clients, indexes)
+        ))
+    finally:
+        for client in clients:
+            await client.aclose()
+    return stats
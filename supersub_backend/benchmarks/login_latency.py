@@ -0,0 +1,81 @@
+"""Login latency under a burst of logins with concurrent catalog reads
+
+Runs login clients and /offers/ readers side by side for a fixed duration
+and reports p50/p99 of both, plus how many logins were shed with a 503:
+
+    python -m benchmarks.login_latency --duration 20 --logins 32 --readers 64
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import List
+
+import httpx
+
+from .server import run_server
+
+EMAIL = "login-bench@example.com"
+PASSWORD = "login-bench-password"
+
+
+def percentile(values: List[float], q: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else float("nan")
+    return statistics.quantiles(values, n=100)[int(q) - 1]
+
+
+async def run(base_url: str, duration: float, logins: int, readers: int) -> None:
+    login_ms: List[float] = []
+    read_ms: List[float] = []
+    login_statuses: Counter = Counter()
+    deadline = time.perf_counter() + duration
+
+    async def login_worker() -> None:
+        # One client per worker: cookies must not be shared
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.post("/auth/login", json={"email": EMAIL, "password": PASSWORD})
+                login_statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    login_ms.append((time.perf_counter() - start) * 1000)
+
+    async def read_worker(client: httpx.AsyncClient) -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get("/offers/")
+            if response.status_code == 200:
+                read_ms.append((time.perf_counter() - start) * 1000)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await client.post("/auth/signup", json={
+            "email": EMAIL, "firstname": "Login", "lastname": "Bench",
+            "age": 30, "gender": "NON_BINARY", "password": PASSWORD,
+        })
+        await asyncio.gather(
+            *(login_worker() for _ in range(logins)),
+            *(read_worker(client) for _ in range(readers)),
+        )
+
+    print(f"logins: {len(login_ms)} ok, statuses {dict(login_statuses)}")
+    print(f"  p50 {percentile(login_ms, 50):8.1f} ms   p99 {percentile(login_ms, 99):8.1f} ms")
+    print(f"catalog reads: {len(read_ms)} ({len(read_ms) / duration:.0f} req/s)")
+    print(f"  p50 {percentile(read_ms, 50):8.1f} ms   p99 {percentile(read_ms, 99):8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    with run_server(args.port) as base_url:
+        asyncio.run(run(base_url, args.duration, args.logins, args.readers))
+
+
+if __name__ == "__main__":
+    main()
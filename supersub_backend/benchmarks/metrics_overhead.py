@@ -0,0 +1,51 @@
+"""Per-request cost of the metrics middleware
+
+Calls a minimal ASGI app directly, with and without MetricsMiddleware, so
+the difference is the middleware alone (no server, no network):
+
+    python -m benchmarks.metrics_overhead --requests 200000
+"""
+import argparse
+import asyncio
+import time
+
+from src.metrics import MetricsMiddleware
+
+
+class _Route:
+    path = "/benchmark/{item_id}"
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def per_request_seconds(app, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET", "path": "/benchmark/1"}, receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    bare = asyncio.run(per_request_seconds(endpoint, args.requests))
+    measured = asyncio.run(per_request_seconds(MetricsMiddleware(endpoint), args.requests))
+    print(f"bare app:        {bare * 1e6:.2f} µs/request")
+    print(f"with middleware: {measured * 1e6:.2f} µs/request")
+    print(f"overhead:        {(measured - bare) * 1e6:.2f} µs/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Page latency of offset vs keyset pagination on /users
+
+Seeds the users table up to --users rows, then times page 1 and page
+--deep-page of both APIs (median of --repeat requests):
+
+    python -m benchmarks.pagination --users 1000000 --deep-page 10000
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import func, insert
+from sqlmodel import Session, select
+
+from src.database import engine
+from src.models.users import GenderType, Users
+from src.pagination import encode_cursor
+
+SEED_BATCH = 10_000
+
+
+def seed_users(total: int) -> None:
+    """Top up the users table to `total` rows with multi-row inserts"""
+    with Session(engine) as session:
+        existing = session.exec(select(func.count()).select_from(Users)).one()
+    for start in range(existing, total, SEED_BATCH):
+        rows = [
+            {
+                "email": f"bench-{i}@example.com",
+                "firstname": "Bench",
+                "lastname": f"User{i}",
+                "age": 18 + i % 60,
+                "gender": GenderType.MALE,
+                "password": "not-a-hash",
+            }
+            for i in range(start, min(start + SEED_BATCH, total))
+        ]
+        with engine.begin() as connection:
+            connection.execute(insert(Users), rows)
+        print(f"\rseeded {start + len(rows)}/{total} users", end="", flush=True)
+    print()
+
+
+def cursor_for_page(page: int, limit: int) -> str:
+    """Cursor of the given page (computed outside of the timed section)"""
+    with Session(engine) as session:
+        statement = select(Users.id).order_by(Users.id).offset((page - 1) * limit - 1).limit(1)
+        return encode_cursor(session.exec(statement).one())
+
+
+def median_ms(client, path: str, params: dict, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path, params=params)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--deep-page", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as client:
+        seed_users(args.users)
+        print(f"{'page':>8} {'offset (ms)':>12} {'keyset (ms)':>12}")
+        for page in (1, args.deep_page):
+            offset_params = {"skip": (page - 1) * args.limit, "limit": args.limit}
+            keyset_params = {"limit": args.limit}
+            if page > 1:
+                keyset_params["cursor"] = cursor_for_page(page, args.limit)
+            offset_ms = median_ms(client, "/users/", offset_params, args.repeat)
+            keyset_ms = median_ms(client, "/users/page", keyset_params, args.repeat)
+            print(f"{page:>8} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Guard against N+1 queries
+
+QueryCounter counts the SQL statements sent through the application engines
+(SQLAlchemy `before_cursor_execute` events) on behalf of a request: the app
+is wrapped to flag the requests' context, so statements from background
+tasks (event log flushes, counter reconciliation) are left out. The check
+below requests every
+list endpoint with growing page sizes and fails if the number of queries
+changes with the page size:
+
+    DATABASE_URL=sqlite:///query_counts.db python -m benchmarks.query_counts
+"""
+import sys
+from contextvars import ContextVar
+from typing import Dict, List
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from src.database import async_engine, engine
+from src.models.offers import Offers
+from src.models.users import GenderType, Users
+
+PAGE_SIZES = [1, 10, 50]
+SEED_USERS = max(PAGE_SIZES) + 1
+
+# Set while the app serves a request; background tasks started at startup never see it
+_in_request: ContextVar[bool] = ContextVar("in_request", default=False)
+
+
+def counted(app):
+    """Wrap an ASGI app so that its requests' statements are counted"""
+
+    async def wrapper(scope, receive, send):
+        if scope["type"] != "http":
+            await app(scope, receive, send)
+            return
+        token = _in_request.set(True)
+        try:
+            await app(scope, receive, send)
+        finally:
+            _in_request.reset(token)
+
+    return wrapper
+
+
+class QueryCounter:
+    """Count statements executed for requests while the context is active"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements: List[str] = []
+        self._engines = [engine] + ([async_engine.sync_engine] if async_engine is not None else [])
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not _in_request.get():
+            return
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self) -> "QueryCounter":
+        for target in self._engines:
+            event.listen(target, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for target in self._engines:
+            event.remove(target, "before_cursor_execute", self._on_execute)
+
+
+def seed_users() -> None:
+    """Make sure there are enough users, spread over offers, to fill every page size"""
+    with Session(engine) as session:
+        offer_ids = session.exec(select(Offers.id)).all()
+        existing = len(session.exec(select(Users.id)).all())
+        for i in range(existing, SEED_USERS):
+            session.add(Users(
+                email=f"query-count-{i}@example.com",
+                firstname="Query",
+                lastname="Count",
+                age=30,
+                gender=GenderType.FEMALE,
+                password="not-a-hash",
+                offer_id=offer_ids[i % len(offer_ids)] if offer_ids else None,
+                previous_offer_id=offer_ids[(i + 1) % len(offer_ids)] if offer_ids else None,
+            ))
+        session.commit()
+
+
+def count_queries(client, path: str) -> int:
+    with QueryCounter() as counter:
+        response = client.get(path)
+    assert response.status_code == 200, f"GET {path} returned {response.status_code}"
+    return counter.count
+
+
+def main() -> int:
+    from fastapi.testclient import TestClient
+    from main import app
+
+    failures = []
+    with TestClient(counted(app)) as client:
+        seed_users()
+
+        client.post("/auth/signup", json={
+            "email": "query-count@example.com", "firstname": "Query", "lastname": "Count",
+            "age": 30, "gender": "MALE", "password": "query-count",
+        })
+        client.post("/auth/login", json={"email": "query-count@example.com", "password": "query-count"})
+        client.post("/subscription/subscribeTo", json={"offer_id": 3})
+
+        paged = {
+            "/users/": lambda size: f"/users/?limit={size}",
+            "/offers/": lambda size: f"/offers/?limit={size}",
+            "/users/page": lambda size: f"/users/page?limit={size}",
+            "/offers/page": lambda size: f"/offers/page?limit={size}",
+        }
+        for name, path_for in paged.items():
+            counts: Dict[int, int] = {size: count_queries(client, path_for(size)) for size in PAGE_SIZES}
+            print(f"{name:<12} " + "  ".join(f"limit={size}: {n}" for size, n in counts.items()))
+            if len(set(counts.values())) != 1:
+                failures.append(f"{name} query count grows with page size: {counts}")
+
+        for path in ["/auth/me", "/users/1", "/offers/1"]:
+            print(f"{path:<12} {count_queries(client, path)} queries")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Check that reads go to the replica and writes (and their follow-up reads) to the primary
+
+Starts the app against two SQLite files: the primary, and a copy of it taken
+before any user exists. A user signed up during the check is only on the
+primary, so whether a read sees it tells which database served it. Redis is
+the in-process stand-in of the load benchmark; both database modes are
+checked:
+
+    python -m benchmarks.replica_routing
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+from .load.environment import prepare
+from .server import run_server
+
+PRIMARY_COOKIE = "db_primary_until"
+SIGNUP = {
+    "email": "replica-routing@example.com", "firstname": "Replica", "lastname": "Routing",
+    "age": 30, "gender": "MALE", "password": "replica-routing",
+}
+# Lets the replica monitor run its first check before requests are sent
+LAG_CHECK_SECONDS = 0.2
+SETTLE_SECONDS = 1.0
+
+
+def database_env(primary: str, replica: str) -> Dict[str, str]:
+    return {
+        "DATABASE_URL": f"sqlite:///{primary}",
+        "ASYNC_DATABASE_URL": f"sqlite+aiosqlite:///{primary}",
+        "DATABASE_REPLICA_URLS": f"sqlite:///{replica}",
+        "ASYNC_DATABASE_REPLICA_URLS": f"sqlite+aiosqlite:///{replica}",
+        "REPLICA_LAG_CHECK_SECONDS": str(LAG_CHECK_SECONDS),
+        # Every authenticated request misses the user cache
+        "USER_CACHE_SIZE": "0",
+    }
+
+
+def listed_emails(client: httpx.Client) -> Optional[Set[str]]:
+    """Emails of the listed users, None if the list could not be read"""
+    response = client.get("/users/", params={"limit": 1000})
+    if response.status_code != 200:
+        return None
+    return {user["email"] for user in response.json()}
+
+
+def check_mode(port: int, directory: str) -> List[str]:
+    failures = []
+
+    def check(ok: bool, description: str) -> None:
+        print(f"  {'ok' if ok else 'FAIL'}: {description}")
+        if not ok:
+            failures.append(description)
+
+    primary = os.path.join(directory, "primary.db")
+    replica = os.path.join(directory, "replica.db")
+    env = database_env(primary, replica)
+    # Create the schema and seed data on the primary only, then copy it
+    with run_server(port, {**env, "DATABASE_REPLICA_URLS": "", "ASYNC_DATABASE_REPLICA_URLS": ""}):
+        pass
+    shutil.copyfile(primary, replica)
+
+    with run_server(port, env) as base_url, httpx.Client(base_url=base_url) as client:
+        time.sleep(SETTLE_SECONDS)
+        response = client.post("/auth/signup", json=SIGNUP)
+        response.raise_for_status()
+        user_id = response.json()["id"]
+        check(PRIMARY_COOKIE in response.cookies, f"writes set {PRIMARY_COOKIE}")
+        check(SIGNUP["email"] in (listed_emails(client) or ()), "reads after a write stay on the primary")
+
+        client.cookies.delete(PRIMARY_COOKIE)
+        emails = listed_emails(client)
+        check(emails is not None and SIGNUP["email"] not in emails, "GET requests read from the replica")
+
+        response = client.post("/subscription/eligible-offers/batch", json={"user_ids": [user_id]})
+        check(
+            response.status_code == 200 and response.json() == [] and PRIMARY_COOKIE not in response.cookies,
+            f"read-only POSTs read from the replica without setting {PRIMARY_COOKIE}",
+        )
+
+        client.post("/auth/login", json={"email": SIGNUP["email"], "password": SIGNUP["password"]}).raise_for_status()
+        client.cookies.delete(PRIMARY_COOKIE)
+        response = client.get("/auth/me")
+        check(
+            response.status_code == 200 and response.json()["email"] == SIGNUP["email"],
+            "get_current_user reads from the primary on a cache miss",
+        )
+
+    unhealthy = {
+        # SQLite cannot open a file in a missing directory
+        "unreachable": {
+            "DATABASE_REPLICA_URLS": f"sqlite:///{directory}/missing/replica.db",
+            "ASYNC_DATABASE_REPLICA_URLS": f"sqlite+aiosqlite:///{directory}/missing/replica.db",
+        },
+        # Any lag is over a negative maximum
+        "lagging": {"REPLICA_MAX_LAG_SECONDS": "-1"},
+    }
+    for label, overrides in unhealthy.items():
+        with run_server(port, {**env, **overrides}) as base_url, httpx.Client(base_url=base_url) as client:
+            time.sleep(SETTLE_SECONDS)
+            check(SIGNUP["email"] in (listed_emails(client) or ()), f"a replica that is {label} is skipped")
+
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    failures = []
+    for async_mode in (False, True):
+        label = "async" if async_mode else "sync"
+        print(f"{label}:")
+        with prepare("local", async_mode), tempfile.TemporaryDirectory(prefix="supersub-replicas-") as directory:
+            failures += [f"{label}: {failure}" for failure in check_mode(args.port, directory)]
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Per-page serialization cost of the users list, default vs fast mode
+
+No database: a page of users with their offers is built in memory, then
+serialized the way each mode does it, through FastAPI's own response
+handling (validation against response_model, encoding):
+
+- models: ORM objects returned to a response_model=List[UsersRead] route
+- fast:   row tuples turned into dicts with pre-built offer dicts, encoded
+          by OrjsonResponse (FAST_RESPONSES=true)
+
+    python -m benchmarks.serialization --page-size 100 --iterations 2000
+"""
+import argparse
+import asyncio
+import time
+from collections import namedtuple
+from typing import List
+
+import httpx
+from fastapi import FastAPI
+
+from src.models.offers import Offers
+from src.models.users import GenderType, Users, UsersRead
+from src.serialization import OrjsonResponse
+
+UserRow = namedtuple("UserRow", "id email firstname lastname age gender offer_id previous_offer_id")
+
+
+def build_page(size: int):
+    offers = [
+        Offers(id=i, title=f"Offer {i}", description="Description " * 5, price=10 + i, benefits="Benefits " * 3)
+        for i in range(1, 4)
+    ]
+    users = []
+    for i in range(size):
+        offer = offers[i % 3]
+        previous = offers[(i + 1) % 3] if i % 2 else None
+        user = Users(
+            id=i + 1, email=f"user{i}@example.com", firstname="Firstname", lastname="Lastname",
+            age=20 + i % 50, gender=GenderType.FEMALE, password="x",
+            offer_id=offer.id, previous_offer_id=previous.id if previous else None,
+        )
+        user.offer = offer
+        user.previous_offer = previous
+        users.append(user)
+    rows = [
+        UserRow(u.id, u.email, u.firstname, u.lastname, u.age, u.gender, u.offer_id, u.previous_offer_id)
+        for u in users
+    ]
+    offer_dicts = {offer.id: offer.model_dump() for offer in offers}
+    return users, rows, offer_dicts
+
+
+def build_app(users, rows, offer_dicts) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/models", response_model=List[UsersRead])
+    async def models():
+        return users
+
+    @app.get("/fast", response_model=List[UsersRead])
+    async def fast():
+        # Same shape as src.routers.users.user_read_dicts
+        return OrjsonResponse([
+            {
+                "id": row.id, "email": row.email, "firstname": row.firstname, "lastname": row.lastname,
+                "age": row.age, "gender": row.gender,
+                "offer_id": row.offer_id, "offer": offer_dicts.get(row.offer_id),
+                "previous_offer_id": row.previous_offer_id, "previous_offer": offer_dicts.get(row.previous_offer_id),
+            }
+            for row in rows
+        ])
+
+    @app.get("/empty")
+    async def empty():
+        return OrjsonResponse([])
+
+    return app
+
+
+async def per_request_seconds(app: FastAPI, path: str, iterations: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(50):
+            await client.get(path)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await client.get(path)
+        return (time.perf_counter() - start) / iterations
+
+
+async def run(page_size: int, iterations: int) -> None:
+    users, rows, offer_dicts = build_page(page_size)
+    app = build_app(users, rows, offer_dicts)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        models_body = (await client.get("/models")).content
+        fast_body = (await client.get("/fast")).content
+    print(f"identical JSON: {models_body == fast_body}")
+
+    # Request handling without any payload, subtracted from both
+    baseline = await per_request_seconds(app, "/empty", iterations)
+    for label, path in (("models", "/models"), ("fast", "/fast")):
+        seconds = await per_request_seconds(app, path, iterations) - baseline
+        print(f"{label:>6}: {seconds * 1e6:8.1f} µs per {page_size}-user page")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.page_size, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
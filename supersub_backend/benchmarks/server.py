@@ -0,0 +1,44 @@
+"""Run the API in a uvicorn subprocess for HTTP benchmarks"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import httpx
+
+
+async def wait_until_ready(base_url: str, timeout: float = 30.0, poll_interval: float = 0.2) -> None:
+    """Poll /health until the server answers"""
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(poll_interval)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+@contextmanager
+def run_server(port: int, env: Optional[Dict[str, str]] = None, workers: int = 1) -> Iterator[str]:
+    """Start `uvicorn main:app` with extra environment variables and yield its base URL"""
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+        ],
+        env=dict(os.environ, **(env or {})),
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        asyncio.run(wait_until_ready(base_url))
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,67 @@
+"""Startup time: cold import of the app and time to the first 200 on /health
+
+Each run starts a fresh interpreter. Against an empty database the first
+server start migrates and seeds; the following ones should only read the
+schema_version row:
+
+    python -m benchmarks.startup --runs 5 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+from .server import wait_until_ready
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def cold_import() -> float:
+    """Seconds to import main (engines, models, routers) in a new interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def first_health(port: int, workers: int) -> float:
+    """Seconds from spawning uvicorn to the first 200 on /health"""
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+        ],
+        env=dict(os.environ),
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(wait_until_ready(f"http://127.0.0.1:{port}", timeout=120, poll_interval=0.01))
+        return time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summary(label: str, seconds: List[float]) -> None:
+    runs = ", ".join(f"{s * 1000:.0f}" for s in seconds)
+    print(f"{label}: median {statistics.median(seconds) * 1000:.0f} ms ({runs})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    summary("cold import", [cold_import() for _ in range(args.runs)])
+    summary(f"first 200 on /health ({args.workers} workers)", [first_health(args.port, args.workers) for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Concurrent subscribe/unsubscribe stress test
+
+Each user fires subscribe and unsubscribe requests for the same offer
+concurrently. The offer does not allow SAME_OFFER, so a subscribe can only
+succeed while the user is off the offer and an unsubscribe only while on it:
+if the writes are atomic, successes alternate and per user
+
+    subscribes - unsubscribes == (1 if the user ends on the offer else 0)
+
+A lost update shows up as two successes in a row. Exits with status 1 if any
+user breaks the invariant:
+
+    python -m benchmarks.subscription_stress --users 20 --requests 200 --workers 4
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+import httpx
+
+from .server import run_server
+
+PASSWORD = "stress-password"
+# Offre Premium: FIRST_SUB, RENEW_SUB and SWITCH_SUB, but not SAME_OFFER
+OFFER_ID = 3
+SUBSCRIBE = "/subscription/subscribeTo"
+UNSUBSCRIBE = "/subscription/unsubscribeTo"
+
+
+async def stress_user(base_url: str, index: int, requests: int, latencies: List[float]) -> Tuple[int, int, int, bool]:
+    """Returns (user id, successful subscribes, successful unsubscribes, ends on the offer)"""
+    email = f"stress-{index}-{time.time_ns()}@example.com"
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        response = await client.post("/auth/signup", json={
+            "email": email, "firstname": "Stress", "lastname": "Test",
+            "age": 30, "gender": "NON_BINARY", "password": PASSWORD,
+        })
+        user_id = response.json()["id"]
+        await client.post("/auth/login", json={"email": email, "password": PASSWORD})
+
+        async def call(path: str) -> bool:
+            start = time.perf_counter()
+            response = await client.post(path, json={"offer_id": OFFER_ID})
+            latencies.append((time.perf_counter() - start) * 1000)
+            return response.status_code == 200
+
+        paths = [SUBSCRIBE, UNSUBSCRIBE] * (requests // 2)
+        random.shuffle(paths)
+        results = await asyncio.gather(*(call(path) for path in paths))
+
+        subscribes = sum(ok for path, ok in zip(paths, results) if path == SUBSCRIBE)
+        unsubscribes = sum(ok for path, ok in zip(paths, results) if path == UNSUBSCRIBE)
+        # Read the row itself, not the cached snapshot behind /auth/me
+        user = (await client.get(f"/users/{user_id}")).json()
+        return user_id, subscribes, unsubscribes, user["offer_id"] == OFFER_ID
+
+
+async def run(base_url: str, users: int, requests: int) -> int:
+    latencies: List[float] = []
+    start = time.perf_counter()
+    results = await asyncio.gather(*(stress_user(base_url, i, requests, latencies) for i in range(users)))
+    elapsed = time.perf_counter() - start
+
+    broken = [
+        (user_id, subscribes, unsubscribes, on_offer)
+        for user_id, subscribes, unsubscribes, on_offer in results
+        if subscribes - unsubscribes != int(on_offer)
+    ]
+    print(f"{len(latencies)} requests in {elapsed:.1f}s, "
+          f"p50 {statistics.median(latencies):.1f} ms, max {max(latencies):.1f} ms")
+    print(f"successful subscribes: {sum(r[1] for r in results)}, unsubscribes: {sum(r[2] for r in results)}")
+    for user_id, subscribes, unsubscribes, on_offer in broken:
+        print(f"  user {user_id}: {subscribes} subscribes, {unsubscribes} unsubscribes, on offer: {on_offer}")
+    print(f"{len(broken)} of {users} users with lost updates")
+    return 1 if broken else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="requests per user, half of each kind")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    with run_server(args.port, workers=args.workers) as base_url:
+        status = asyncio.run(run(base_url, args.users, args.requests))
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
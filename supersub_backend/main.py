@@ -1,18 +1,39 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
-from src.database import create_db_and_tables
-from src.routers import offers, users
+from src import broadcast, metrics, offer_stats, profiling, redis_client
+from src.auth.hashing import shutdown_executor
+from src.auth.revocation import revocation_list
+from src.catalog import offer_catalog
+from src.database import create_db_and_tables, dispose_engines, replicas
+from src.routers import debug, offers, users
 from src.auth import router as auth_router
 from src.subscription import router as subscription_router
+from src.subscription.events import event_buffer
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables at startup
+    # Create tables and seed data, or only check the schema version when already applied
     create_db_and_tables()
+    # Warm the offer catalog and follow its invalidations from other workers
+    await offer_catalog.reload()
+    await revocation_list.rebuild()
+    listener = asyncio.create_task(broadcast.listen())
+    # Subscription events are written behind the requests, in batches
+    event_writer = asyncio.create_task(event_buffer.run())
+    stats_reconciler = asyncio.create_task(offer_stats.run())
+    replica_monitor = asyncio.create_task(replicas.monitor())
+    redis_monitor = asyncio.create_task(redis_client.monitor_circuit())
     yield
+    for task in (listener, event_writer, stats_reconciler, replica_monitor, redis_monitor):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    shutdown_executor()
+    await dispose_engines()
 
 
 app = FastAPI(
@@ -30,12 +51,16 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all methods including OPTIONS
     allow_headers=["*"],  # Allow all headers
 )
+app.add_middleware(profiling.ProfilingMiddleware)
+# Outermost, so that it also times CORS preflights and error responses
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Include routes
 app.include_router(auth_router.router)
 app.include_router(subscription_router.router)
 app.include_router(offers.router)
 app.include_router(users.router)
+app.include_router(debug.router)
 
 
 @app.get("/")
@@ -45,4 +70,10 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Prometheus metrics of the worker serving the scrape"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
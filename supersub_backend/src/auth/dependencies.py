@@ -3,14 +3,23 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlmodel import Session, select
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 import os
+import time
+import uuid
 import redis
 from dotenv import load_dotenv
 
-from ..database import get_session
+from .. import profiling
+from ..database import session_scope
 from ..models.users import Users
+from ..redis_client import redis_client
+from .hashing import verify_and_update_password
+from .revocation import revocation_list
+from .token_cache import token_cache
+from .user_cache import user_cache
 
 load_dotenv()
 
@@ -19,30 +28,9 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # HTTP Bearer token scheme
 security = HTTPBearer()
 
-# Redis connection for token blacklist
-redis_client = redis.Redis(
-    host=os.getenv("REDIS_HOST", "localhost"),
-    port=int(os.getenv("REDIS_PORT", "6379")),
-    db=int(os.getenv("REDIS_DB", "0")),
-    decode_responses=True
-)
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a plain password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
-
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
@@ -52,44 +40,71 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # jti identifies the token for revocation
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    start = time.perf_counter()
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    profiling.record("jwt", time.perf_counter() - start)
     return encoded_jwt
 
 
 def verify_token(token: str) -> Optional[dict]:
-    """Verify and decode a JWT token"""
+    """Verify and decode a JWT token (signature checks are skipped for cached tokens)"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+    start = time.perf_counter()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    finally:
+        profiling.record("jwt", time.perf_counter() - start)
+    token_cache.put(token, payload)
+    return payload
 
 
-def authenticate_user(session: Session, email: str, password: str) -> Optional[Users]:
+async def authenticate_user(session: AsyncSession, email: str, password: str) -> Optional[Users]:
     """Authenticate a user with email and password"""
-    user = session.exec(select(Users).where(Users.email == email)).first()
+    user = (await session.exec(select(Users).where(Users.email == email))).first()
     if not user:
         return None
-    if not verify_password(password, user.password):
+    valid, new_hash = await verify_and_update_password(password, user.password)
+    if not valid:
         return None
+    if new_hash:
+        # Stored with an outdated bcrypt cost: upgrade it transparently
+        user.password = new_hash
+        session.add(user)
+        await session.commit()
     return user
 
 
-def is_token_blacklisted(token: str) -> bool:
-    """Check if token is blacklisted in Redis"""
+async def is_token_blacklisted(token: str) -> bool:
+    """Check if a token issued without jti is blacklisted in Redis
+
+    Legacy path for tokens minted before revocation by jti; it can be
+    removed once they have all expired.
+    """
     try:
-        return redis_client.exists(f"blacklist:{token}") == 1
+        return await redis_client.exists(f"blacklist:{token}") == 1
     except redis.RedisError:
         # If Redis is down, allow the request (fail open)
         return False
 
 
-def blacklist_token(token: str) -> None:
-    """Add token to blacklist in Redis with expiration based on token's remaining time"""
+async def blacklist_token(token: str) -> None:
+    """Revoke a token until its expiration"""
+    # Decode token to get expiration time, then drop its cached claims
+    payload = verify_token(token)
+    token_cache.evict(token)
+    if payload and "jti" in payload:
+        remaining_seconds = int(payload["exp"] - datetime.utcnow().timestamp())
+        if remaining_seconds > 0:
+            await revocation_list.revoke(payload["jti"], remaining_seconds)
+        return
+
     try:
-        # Decode token to get expiration time
-        payload = verify_token(token)
         if payload and "exp" in payload:
             exp_timestamp = payload["exp"]
             current_timestamp = datetime.utcnow().timestamp()
@@ -97,20 +112,21 @@ def blacklist_token(token: str) -> None:
             
             # Only blacklist if token hasn't expired yet
             if remaining_seconds > 0:
-                redis_client.setex(f"blacklist:{token}", remaining_seconds, "1")
+                await redis_client.setex(f"blacklist:{token}", remaining_seconds, "1")
         else:
             # Fallback to default expiration if we can't decode the token
-            redis_client.setex(f"blacklist:{token}", ACCESS_TOKEN_EXPIRE_MINUTES * 60, "1")
+            await redis_client.setex(f"blacklist:{token}", ACCESS_TOKEN_EXPIRE_MINUTES * 60, "1")
     except redis.RedisError:
         # If Redis is down, log the error but don't fail the request
         pass
 
 
-def get_current_user(
-    request: Request,
-    session: Session = Depends(get_session)
-) -> Users:
-    """Get the current authenticated user from JWT token in HTTP-only cookie"""
+async def get_current_user(request: Request) -> Users:
+    """Get the current authenticated user from JWT token in HTTP-only cookie
+
+    The user is read from the primary, never from a replica, so a lagging
+    replica cannot put an outdated user (or token version) in the cache.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -122,33 +138,57 @@ def get_current_user(
     if not token:
         raise credentials_exception
     
-    # Check if token is blacklisted
-    if is_token_blacklisted(token):
-        raise credentials_exception
-    
     try:
         payload = verify_token(token)
         if payload is None:
             raise credentials_exception
         
+        # Check if token has been revoked
+        jti = payload.get("jti")
+        if jti is not None:
+            if await revocation_list.is_revoked(jti):
+                raise credentials_exception
+        elif await is_token_blacklisted(token):
+            raise credentials_exception
+        
         user_id = payload.get("sub")
         if user_id is None:
             raise credentials_exception
         
         user_id = int(user_id)
+        token_version = int(payload.get("ver", 0))
             
-    except JWTError:
+    except (JWTError, ValueError):
         raise credentials_exception
     
-    # Use select with options to load the offer relationship
-    statement = select(Users).where(Users.id == user_id)
-    user = session.exec(statement).first()
+    user = await user_cache.get(user_id)
     if user is None:
+        statement = select(Users).where(Users.id == user_id)
+        async with session_scope() as session:
+            user = (await session.exec(statement)).first()
+        if user is None:
+            raise credentials_exception
+        await user_cache.put(user)
+    
+    # Tokens issued before the user's last "log out everywhere" are rejected
+    if token_version != user.token_version:
         raise credentials_exception
     
     return user
 
 
-def get_current_active_user(current_user: Users = Depends(get_current_user)) -> Users:
+async def revoke_all_tokens(session: AsyncSession, user_id: int) -> None:
+    """Invalidate every token issued to a user so far"""
+    statement = (
+        update(Users)
+        .where(Users.id == user_id)
+        .values(token_version=Users.token_version + 1)
+    )
+    await session.exec(statement)
+    await session.commit()
+    await user_cache.invalidate([user_id])
+
+
+async def get_current_active_user(current_user: Users = Depends(get_current_user)) -> Users:
     """Get the current active user (can be extended to check if user is active)"""
     return current_user
\ No newline at end of file
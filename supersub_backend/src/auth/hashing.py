@@ -0,0 +1,130 @@
+"""Password hashing
+
+bcrypt is deliberately slow and CPU bound, so it never runs on the request
+path: hashes and verifications go to a process pool sized to the number of
+cores. The number of pending operations is bounded; beyond that requests
+get a 503 instead of queueing up and starving the cheap endpoints.
+
+Bulk imports hash on a separate, smaller pool (HASHING_IMPORT_WORKERS) so
+that a large import cannot take every core away from logins and signups,
+which keep their own pool and pending bound.
+
+The bcrypt cost is configurable (BCRYPT_ROUNDS). Hashes stored with another
+cost are rehashed when their owner logs in.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from .. import metrics, profiling
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+HASHING_WORKERS = int(os.getenv("HASHING_WORKERS", str(os.cpu_count() or 1)))
+# Operations waiting for or running on the pool before answering 503
+HASHING_MAX_PENDING = int(os.getenv("HASHING_MAX_PENDING", str(HASHING_WORKERS * 8)))
+# Processes of the bulk import pool, half of the cores by default
+HASHING_IMPORT_WORKERS = int(os.getenv("HASHING_IMPORT_WORKERS", str(max(1, HASHING_WORKERS // 2))))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_import_executor: Optional[ProcessPoolExecutor] = None
+_pending = 0
+
+
+def _hash_many(passwords: List[str]) -> List[str]:
+    return [pwd_context.hash(password) for password in passwords]
+
+
+def _verify_and_update(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, password_hash)
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    # Forking a process running the event loop and its threads is unsafe
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Process pool of the interactive hashing tasks of this worker (created on first use)"""
+    global _executor
+    if _executor is None:
+        _executor = _process_pool(HASHING_WORKERS)
+    return _executor
+
+
+def get_import_executor() -> ProcessPoolExecutor:
+    """Process pool of bulk imports (created on first use)"""
+    global _import_executor
+    if _import_executor is None:
+        _import_executor = _process_pool(HASHING_IMPORT_WORKERS)
+    return _import_executor
+
+
+async def _run_bounded(operation: str, func: Callable[..., Any], *args: Any) -> Any:
+    global _pending
+    if _pending >= HASHING_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry later",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), func, *args)
+    finally:
+        _pending -= 1
+        elapsed = time.perf_counter() - start
+        metrics.password_hashing_duration.observe((operation,), elapsed)
+        profiling.record("bcrypt", elapsed)
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password on the process pool"""
+    return (await _run_bounded("hash", _hash_many, [password]))[0]
+
+
+async def verify_and_update_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password on the process pool
+
+    Returns whether it matches and, if the hash uses an outdated cost, a new
+    hash to store in its place.
+    """
+    return await _run_bounded("verify", _verify_and_update, password, password_hash)
+
+
+async def _hash_chunk(chunk: List[str]) -> List[str]:
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_import_executor(), _hash_many, chunk)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.password_hashing_duration.observe(("import",), elapsed)
+        profiling.record("bcrypt", elapsed)
+
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash many passwords in parallel across the import pool (bulk imports)"""
+    if not passwords:
+        return []
+    # A few chunks per process keeps the pool busy with little IPC overhead
+    size = max(1, len(passwords) // (HASHING_IMPORT_WORKERS * 4))
+    chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    hashed = await asyncio.gather(*(_hash_chunk(chunk) for chunk in chunks))
+    return [password_hash for chunk in hashed for password_hash in chunk]
+
+
+def shutdown_executor() -> None:
+    global _executor, _import_executor
+    for executor in (_executor, _import_executor):
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    _executor = _import_executor = None
@@ -0,0 +1,139 @@
+"""Revocation of access tokens by jti
+
+A revoked token id is stored in Redis (`revoked:{jti}`, expiring with the
+token) and published to every worker. Each worker keeps an in-process Bloom
+filter of revoked ids, so the common "not revoked" answer needs no network
+call; Redis is only asked to confirm when the filter reports a hit.
+
+The filter is rebuilt from Redis at startup and then periodically, which
+drops ids whose token has expired. Until the first rebuild succeeds every
+check goes to Redis.
+
+Each worker also mirrors the most recent revoked ids exactly. A filter hit
+found in the mirror needs no confirmation, and while Redis is unreachable (or
+its circuit is open) the mirror answers on its own: recent revocations are
+still enforced, older ones fail open.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import redis
+from dotenv import load_dotenv
+
+from .. import broadcast
+from ..redis_client import redis_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHANNEL = "auth:revocations"
+REVOKED_KEY_PREFIX = "revoked:"
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", "100000"))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", "0.01"))
+REVOCATION_REBUILD_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", "1800"))
+# Most recent revoked ids mirrored exactly in each worker
+REVOCATION_MIRROR_SIZE = int(os.getenv("REVOCATION_MIRROR_SIZE", "10000"))
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Double hashing: k positions derived from two 64-bit hashes
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    def __init__(self):
+        self._filter = BloomFilter(REVOCATION_FILTER_CAPACITY, REVOCATION_FILTER_ERROR_RATE)
+        # Filter being rebuilt: revocations received meanwhile go to both
+        self._next: Optional[BloomFilter] = None
+        self._built_at: Optional[float] = None
+        self._rebuilding = False
+        self._rebuild_task: Optional[asyncio.Task] = None
+        # Expired ids can stay: their tokens fail verification anyway
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+
+    async def rebuild(self) -> None:
+        """Rebuild the filter from the revoked ids currently stored in Redis"""
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+        self._next = BloomFilter(REVOCATION_FILTER_CAPACITY, REVOCATION_FILTER_ERROR_RATE)
+        try:
+            async for key in redis_client.scan_iter(match=f"{REVOKED_KEY_PREFIX}*", count=1000):
+                jti = key[len(REVOKED_KEY_PREFIX):]
+                self._next.add(jti)
+                self._remember(jti)
+            self._filter = self._next
+            self._built_at = time.monotonic()
+        except redis.RedisError as e:
+            logger.warning("Could not rebuild the revocation filter: %s", e)
+        finally:
+            self._next = None
+            self._rebuilding = False
+
+    def _remember(self, jti: str) -> None:
+        self._recent[jti] = None
+        self._recent.move_to_end(jti)
+        if len(self._recent) > REVOCATION_MIRROR_SIZE:
+            self._recent.popitem(last=False)
+
+    def _add_local(self, jti: str) -> None:
+        self._filter.add(jti)
+        if self._next is not None:
+            self._next.add(jti)
+        self._remember(jti)
+
+    async def revoke(self, jti: str, ttl_seconds: int) -> None:
+        """Revoke a token id until its token expires"""
+        self._add_local(jti)
+        try:
+            await redis_client.setex(f"{REVOKED_KEY_PREFIX}{jti}", ttl_seconds, "1")
+        except redis.RedisError:
+            # If Redis is down, only this worker enforces the revocation
+            return
+        await broadcast.publish(REVOCATION_CHANNEL, jti)
+
+    async def is_revoked(self, jti: str) -> bool:
+        if self._built_at is not None:
+            if time.monotonic() - self._built_at > REVOCATION_REBUILD_SECONDS and not self._rebuilding:
+                self._rebuild_task = asyncio.create_task(self.rebuild())
+            if jti not in self._filter:
+                return False
+        if jti in self._recent:
+            return True
+        try:
+            return await redis_client.exists(f"{REVOKED_KEY_PREFIX}{jti}") == 1
+        except redis.RedisError:
+            # Redis is down or its circuit open: older revocations fail open
+            return False
+
+    async def _on_revoked(self, jti: str) -> None:
+        self._add_local(jti)
+
+
+revocation_list = RevocationList()
+broadcast.subscribe(REVOCATION_CHANNEL, revocation_list._on_revoked)
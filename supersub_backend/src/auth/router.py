@@ -1,18 +1,22 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.security import HTTPAuthorizationCredentials
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from ..catalog import offer_catalog
+from ..conditional import PRIVATE_CACHE_CONTROL, cache_headers, etag_matches, not_modified
 from ..database import get_session
 from ..models.users import Users, GenderType
 from ..models.offers import OffersRead
 from .models import UserLogin, UserSignup, Token, UserProfile
+from .hashing import hash_password
 from .dependencies import (
     authenticate_user,
     create_access_token,
-    get_password_hash,
     get_current_active_user,
     blacklist_token,
+    revoke_all_tokens,
     security,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
@@ -21,10 +25,10 @@ router = APIRouter(prefix="/auth", tags=["authentication"])
 
 
 @router.post("/signup", response_model=UserProfile)
-def signup(user_data: UserSignup, session: Session = Depends(get_session)):
+async def signup(user_data: UserSignup, session: AsyncSession = Depends(get_session)):
     """Register a new user"""
     # Check if email already exists
-    existing_user = session.exec(select(Users).where(Users.email == user_data.email)).first()
+    existing_user = (await session.exec(select(Users).where(Users.email == user_data.email))).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -41,7 +45,7 @@ def signup(user_data: UserSignup, session: Session = Depends(get_session)):
         )
     
     # Hash password and create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     
     db_user = Users(
         email=user_data.email,
@@ -53,8 +57,7 @@ def signup(user_data: UserSignup, session: Session = Depends(get_session)):
     )
     
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
     
     return UserProfile(
         id=db_user.id or 0,
@@ -67,9 +70,9 @@ def signup(user_data: UserSignup, session: Session = Depends(get_session)):
 
 
 @router.post("/login")
-def login(user_credentials: UserLogin, response: Response, session: Session = Depends(get_session)):
+async def login(user_credentials: UserLogin, response: Response, session: AsyncSession = Depends(get_session)):
     """Authenticate user and set JWT token as HTTP-only cookie"""
-    user = authenticate_user(session, user_credentials.email, user_credentials.password)
+    user = await authenticate_user(session, user_credentials.email, user_credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -79,7 +82,7 @@ def login(user_credentials: UserLogin, response: Response, session: Session = De
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
+        data={"sub": str(user.id), "ver": user.token_version}, expires_delta=access_token_expires
     )
     
     # Set HTTP-only cookie
@@ -96,12 +99,12 @@ def login(user_credentials: UserLogin, response: Response, session: Session = De
 
 
 @router.post("/logout")
-def logout(request: Request, response: Response):
+async def logout(request: Request, response: Response):
     """Logout user by blacklisting the token and clearing cookie"""
     # Get token from HTTP-only cookie
     token = request.cookies.get("jwt")
     if token:
-        blacklist_token(token)
+        await blacklist_token(token)
     
     # Clear the HTTP-only cookie
     response.delete_cookie(
@@ -114,29 +117,64 @@ def logout(request: Request, response: Response):
     return {"message": "Successfully logged out"}
 
 
+@router.post("/logout-all")
+async def logout_all(
+    response: Response,
+    current_user: Users = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """Logout user from every device by revoking all of their tokens"""
+    await revoke_all_tokens(session, current_user.id)
+    
+    # Clear the HTTP-only cookie
+    response.delete_cookie(
+        key="jwt",
+        httponly=True,
+        secure=False,  # Set to True in production with HTTPS
+        samesite="strict"
+    )
+    
+    return {"message": "Successfully logged out from all sessions"}
+
+
 @router.get("/me", response_model=UserProfile)
-def get_current_user_profile(current_user: Users = Depends(get_current_active_user)):
+async def get_current_user_profile(
+    request: Request,
+    response: Response,
+    current_user: Users = Depends(get_current_active_user)
+):
     """Get current user's profile information"""
+    # Offers and their access rules come from the in-memory catalog
+    catalog = await offer_catalog.get()
+
+    # The user usually comes from the snapshot cache: a revalidation costs no query
+    etag = f'"u{current_user.id}-{current_user.row_version}-{catalog.digest}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, PRIVATE_CACHE_CONTROL)
+    response.headers.update(cache_headers(etag, PRIVATE_CACHE_CONTROL))
+
     offer_data = None
-    if current_user.offer and current_user.offer.id is not None:
+    offer = catalog.offers.get(current_user.offer_id)
+    if offer and offer.id is not None:
         offer_data = OffersRead(
-            id=current_user.offer.id,
-            title=current_user.offer.title,
-            description=current_user.offer.description,
-            price=current_user.offer.price,
-            benefits=current_user.offer.benefits,
-            access_rules=current_user.offer.access_rules
+            id=offer.id,
+            title=offer.title,
+            description=offer.description,
+            price=offer.price,
+            benefits=offer.benefits,
+            access_rules=offer.access_rules
         )
     
     previous_offer_data = None
-    if current_user.previous_offer and current_user.previous_offer.id is not None:
+    previous_offer = catalog.offers.get(current_user.previous_offer_id)
+    if previous_offer and previous_offer.id is not None:
         previous_offer_data = OffersRead(
-            id=current_user.previous_offer.id,
-            title=current_user.previous_offer.title,
-            description=current_user.previous_offer.description,
-            price=current_user.previous_offer.price,
-            benefits=current_user.previous_offer.benefits,
-            access_rules=current_user.previous_offer.access_rules
+            id=previous_offer.id,
+            title=previous_offer.title,
+            description=previous_offer.description,
+            price=previous_offer.price,
+            benefits=previous_offer.benefits,
+            access_rules=previous_offer.access_rules
         )
     
     return UserProfile(
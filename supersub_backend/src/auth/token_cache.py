@@ -0,0 +1,61 @@
+"""Cache of decoded JWT claims
+
+The same cookie is presented on every request during its lifetime, so the
+claims of recently seen tokens are kept in a bounded LRU keyed by a hash of
+the token, until the token's own expiry. Logging out evicts the entry.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from .. import metrics
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+
+def _key(token: str) -> bytes:
+    # Tokens are bearer credentials: keep only a digest in memory
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, dict]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Claims of `token` if cached and not expired"""
+        key = _key(token)
+        claims = self._entries.get(key)
+        if claims is None or claims.get("exp", 0) <= time.time():
+            if claims is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        """Cache verified claims; tokens without an expiry are not cached"""
+        if self.max_size <= 0 or "exp" not in claims:
+            return
+        key = _key(token)
+        self._entries[key] = claims
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def evict(self, token: str) -> None:
+        self._entries.pop(_key(token), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+metrics.register_cache("token", token_cache.stats)
@@ -0,0 +1,123 @@
+"""Cache of authenticated users
+
+Every authenticated request needs the caller's row. A snapshot of it (all
+columns but the password hash) is kept in Redis, shared by the workers, and
+in a small per-worker LRU in front of it, both with a short TTL. Writes to a
+user invalidate both tiers on every worker through pub/sub.
+
+Snapshots are returned as detached `Users` instances: handlers that modify
+the user must load their own row in their session.
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import redis
+from dotenv import load_dotenv
+
+from .. import broadcast, metrics
+from ..models.users import GenderType, Users
+from ..redis_client import redis_client
+
+load_dotenv()
+
+USER_CACHE_CHANNEL = "users:invalidated"
+USER_CACHE_KEY_PREFIX = "users:snapshot:"
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+SNAPSHOT_FIELDS = [
+    column.name for column in Users.__table__.columns if column.name != "password"
+]
+
+
+def _snapshot(user: Users) -> Dict:
+    return {field: getattr(user, field) for field in SNAPSHOT_FIELDS}
+
+
+def _from_snapshot(snapshot: Dict) -> Users:
+    # Table models skip validation: restore the enum by hand
+    return Users(**{**snapshot, "gender": GenderType(snapshot["gender"])})
+
+
+class UserCache:
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
+
+    def _get_local(self, user_id: int) -> Optional[Dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return snapshot
+
+    def _put_local(self, user_id: int, snapshot: Dict) -> None:
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, snapshot)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, user_id: int) -> Optional[Users]:
+        """Cached user, or None if it has to be read from the database"""
+        if self.max_size <= 0:
+            return None
+        snapshot = self._get_local(user_id)
+        if snapshot is None:
+            try:
+                raw = await redis_client.get(f"{USER_CACHE_KEY_PREFIX}{user_id}")
+            except redis.RedisError:
+                raw = None
+            if raw is None:
+                self.misses += 1
+                return None
+            snapshot = json.loads(raw)
+            self._put_local(user_id, snapshot)
+        self.hits += 1
+        return _from_snapshot(snapshot)
+
+    async def put(self, user: Users) -> None:
+        if self.max_size <= 0 or user.id is None:
+            return
+        snapshot = _snapshot(user)
+        self._put_local(user.id, snapshot)
+        try:
+            await redis_client.setex(
+                f"{USER_CACHE_KEY_PREFIX}{user.id}", self.ttl_seconds, json.dumps(snapshot)
+            )
+        except redis.RedisError:
+            pass
+
+    async def invalidate(self, user_ids: Iterable[int]) -> None:
+        """Drop users from every worker's cache; call after the write is committed"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+        try:
+            await redis_client.delete(*(f"{USER_CACHE_KEY_PREFIX}{user_id}" for user_id in user_ids))
+        except redis.RedisError:
+            pass
+        await broadcast.publish(USER_CACHE_CHANNEL, ",".join(map(str, user_ids)))
+
+    async def _on_invalidated(self, message: str) -> None:
+        for user_id in message.split(","):
+            self._entries.pop(int(user_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+broadcast.subscribe(USER_CACHE_CHANNEL, user_cache._on_invalidated)
+metrics.register_cache("user", user_cache.stats)
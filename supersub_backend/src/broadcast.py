@@ -0,0 +1,58 @@
+"""Cross-worker notifications over Redis pub/sub
+
+Modules register a handler per channel at import time; every uvicorn worker
+runs a single listener task (started in the app lifespan) that dispatches
+incoming messages to those handlers.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List
+
+import redis
+
+from .redis_client import pubsub_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str], Awaitable[None]]
+
+RECONNECT_DELAY_SECONDS = 1.0
+
+_handlers: Dict[str, List[Handler]] = {}
+
+
+def subscribe(channel: str, handler: Handler) -> None:
+    """Call `handler` with the payload of every message published on `channel`"""
+    _handlers.setdefault(channel, []).append(handler)
+
+
+async def publish(channel: str, message: str) -> None:
+    """Notify every worker; failures are logged since pub/sub is best effort"""
+    try:
+        await redis_client.publish(channel, message)
+    except redis.RedisError as e:
+        logger.warning("Could not publish on %s: %s", channel, e)
+
+
+async def listen() -> None:
+    """Dispatch messages to the registered handlers until cancelled"""
+    if not _handlers:
+        return
+
+    while True:
+        pubsub = pubsub_client.pubsub()
+        try:
+            await pubsub.subscribe(*_handlers)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                for handler in _handlers.get(message["channel"], []):
+                    try:
+                        await handler(message["data"])
+                    except Exception:
+                        logger.exception("Handler failed for message on %s", message["channel"])
+        except redis.RedisError as e:
+            logger.warning("Pub/sub connection lost, reconnecting: %s", e)
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+        finally:
+            await pubsub.aclose()
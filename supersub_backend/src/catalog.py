@@ -0,0 +1,141 @@
+"""In-memory offer catalog
+
+The catalog has a handful of rows and changes rarely, so every worker keeps
+all offers (with their access rules) in memory together with their
+pre-serialized OffersRead JSON. Reads never touch the database.
+
+Writes bump a version counter in Redis and publish it so that every worker
+reloads its copy. A maximum age bounds staleness if a message is missed.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import redis
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+
+from . import broadcast
+from .redis_client import redis_client
+from .database import session_scope
+from .models.offers import Offers, OffersRead
+from .subscription.rules import AccessRuleTable
+
+CATALOG_CHANNEL = "offers:catalog"
+CATALOG_VERSION_KEY = "offers:catalog:version"
+CATALOG_MAX_AGE_SECONDS = float(os.getenv("CATALOG_MAX_AGE_SECONDS", "300"))
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Immutable view of the catalog at a given version"""
+    version: int
+    loaded_at: float
+    offers: Dict[int, Offers]  # Detached instances, access_rules loaded
+    offers_json: Dict[int, bytes]  # OffersRead JSON per offer
+    offer_dicts: Dict[int, dict]  # Offer columns without access rules, as nested in UsersRead
+    offer_etags: Dict[int, str]  # Strong ETag of each offer's JSON
+    digest: str  # Hash of every offer's JSON, part of the list and /auth/me ETags
+    ids: List[int]  # Offer ids ordered by id
+    access: AccessRuleTable  # Access rules compiled for eligibility checks
+
+    @property
+    def etag(self) -> str:
+        """Strong ETag of responses built from the whole catalog"""
+        return f'"c-{self.digest}"'
+
+    def json_array(self, ids: List[int]) -> bytes:
+        """JSON array of the given offers"""
+        return b"[" + b",".join(self.offers_json[offer_id] for offer_id in ids) + b"]"
+
+    def page_json(self, skip: int = 0, limit: int = 100) -> bytes:
+        """JSON array of the offers in [skip, skip + limit)"""
+        return self.json_array(self.ids[max(skip, 0):max(skip, 0) + max(limit, 0)])
+
+    def ids_after(self, after_id: Optional[int], limit: int) -> Tuple[List[int], bool]:
+        """Up to `limit` offer ids greater than `after_id`, and whether more follow"""
+        start = bisect_right(self.ids, after_id) if after_id is not None else 0
+        return self.ids[start:start + limit], start + limit < len(self.ids)
+
+
+def _digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:20]
+
+
+class OfferCatalog:
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> CatalogSnapshot:
+        """Current snapshot, loaded from the database only if missing or too old"""
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > CATALOG_MAX_AGE_SECONDS:
+            return await self.reload()
+        return snapshot
+
+    async def reload(self) -> CatalogSnapshot:
+        """Load every offer and its access rules in one pass"""
+        requested_at = time.monotonic()
+        async with self._lock:
+            # Another request may have reloaded while we were waiting
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.loaded_at >= requested_at:
+                return snapshot
+
+            version = await self._read_version()
+            async with session_scope() as session:
+                statement = select(Offers).options(selectinload(Offers.access_rules)).order_by(Offers.id)
+                offers = (await session.exec(statement)).all()
+
+            offers_json = {
+                offer.id: OffersRead.model_validate(offer).model_dump_json().encode()
+                for offer in offers
+            }
+            # Derived from the content rather than the version counter, which
+            # stays put while Redis is unreachable
+            self._snapshot = CatalogSnapshot(
+                version=version,
+                loaded_at=time.monotonic(),
+                offers={offer.id: offer for offer in offers},
+                offers_json=offers_json,
+                offer_dicts={offer.id: offer.model_dump() for offer in offers},
+                offer_etags={offer_id: f'"o{offer_id}-{_digest(body)}"' for offer_id, body in offers_json.items()},
+                digest=_digest(b"".join(offers_json.values())),
+                ids=[offer.id for offer in offers],
+                access=AccessRuleTable(offers),
+            )
+            return self._snapshot
+
+    async def invalidate(self) -> None:
+        """Bump the version after a write and make every worker reload"""
+        version = await self._bump_version()
+        await self.reload()
+        if version is not None:
+            await broadcast.publish(CATALOG_CHANNEL, str(version))
+
+    async def _on_version(self, message: str) -> None:
+        snapshot = self._snapshot
+        if snapshot is None or int(message) != snapshot.version:
+            await self.reload()
+
+    async def _read_version(self) -> int:
+        try:
+            return int(await redis_client.get(CATALOG_VERSION_KEY) or 0)
+        except redis.RedisError:
+            # Keep serving the local version: the max age bounds staleness
+            return self._snapshot.version if self._snapshot else 0
+
+    async def _bump_version(self) -> Optional[int]:
+        try:
+            return await redis_client.incr(CATALOG_VERSION_KEY)
+        except redis.RedisError:
+            return None
+
+
+offer_catalog = OfferCatalog()
+broadcast.subscribe(CATALOG_CHANNEL, offer_catalog._on_version)
@@ -0,0 +1,126 @@
+"""Circuit breaker for calls to a shared dependency
+
+After `failure_threshold` consecutive failures the circuit opens: calls are
+rejected at once with `open_error` instead of each waiting out its timeout.
+Once `reset_seconds` have passed the circuit is half-open and lets a single
+trial call through (a real call or a probe from `monitor`): success closes
+the circuit, failure opens it again for another `reset_seconds`.
+
+Only failures of the dependency itself count (`failure_types`, e.g.
+connection errors and timeouts); errors in the caller's request do not.
+State, transitions and rejected calls are exported on /metrics.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Type
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# Gauge values, ordered by severity
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_breakers: List["CircuitBreaker"] = []
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_seconds: float,
+        failure_types: Tuple[Type[BaseException], ...],
+        open_error: Type[Exception]
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failure_types = failure_types
+        self.open_error = open_error
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._changed_at = time.monotonic()
+        _breakers.append(self)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning("Circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        self._changed_at = time.monotonic()
+        transitions.inc((self.name, state))
+
+    def before_call(self) -> None:
+        """Raise `open_error` unless the call may go through"""
+        if self.state == CLOSED:
+            return
+        # Open for long enough: this call is the trial. Half-open for as long
+        # means the previous trial never finished (cancelled): allow another.
+        if time.monotonic() - self._changed_at >= self.reset_seconds:
+            self._transition(HALF_OPEN)
+            self._changed_at = time.monotonic()
+            return
+        self.rejected += 1
+        rejections.inc((self.name,))
+        raise self.open_error(f"Circuit {self.name} is {self.state}")
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self._transition(OPEN)
+
+    async def call(self, function: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """Await `function` through the breaker"""
+        self.before_call()
+        try:
+            result = await function(*args, **kwargs)
+        except self.failure_types:
+            self.record_failure()
+            raise
+        except Exception:
+            # The dependency answered, with an error of the caller's making
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    async def monitor(self, probe: Callable[[], Awaitable[Any]], interval_seconds: float) -> None:
+        """Send `probe` as the trial call whenever the circuit is due for one, until cancelled"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            if self.state == CLOSED or time.monotonic() - self._changed_at < self.reset_seconds:
+                continue
+            try:
+                await self.call(probe)
+            except Exception as error:
+                logger.info("Circuit %s probe failed: %s", self.name, error)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "rejected": self.rejected,
+            "seconds_in_state": round(time.monotonic() - self._changed_at, 1),
+        }
+
+
+transitions = metrics.Counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes", ("name", "state")
+)
+rejections = metrics.Counter(
+    "circuit_breaker_rejected_total", "Calls rejected while a circuit was not closed", ("name",)
+)
+metrics.Gauge(
+    "circuit_breaker_state", "0 closed, 1 half-open, 2 open", ("name",),
+    lambda: {(breaker.name,): STATE_VALUES[breaker.state] for breaker in _breakers},
+)
@@ -0,0 +1,37 @@
+"""Conditional GET: strong ETags and 304 Not Modified responses
+
+Clients revalidate with If-None-Match; when the representation has not
+changed the handler answers 304 from the ETag alone, before building or
+serializing the body.
+"""
+from fastapi import Request, Response
+
+# Cached, but revalidated on every use
+PUBLIC_CACHE_CONTROL = "no-cache"
+# Per-user responses must not be stored by shared caches
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match lists `etag` (weak comparison, as required for GET)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def cache_headers(etag: str, cache_control: str = PUBLIC_CACHE_CONTROL) -> dict:
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def not_modified(etag: str, cache_control: str = PUBLIC_CACHE_CONTROL) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, cache_control))
+
+
+def json_response(request: Request, etag: str, content: bytes, cache_control: str = PUBLIC_CACHE_CONTROL) -> Response:
+    """Pre-serialized JSON body, or 304 if the client already has it"""
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    return Response(content=content, media_type="application/json", headers=cache_headers(etag, cache_control))
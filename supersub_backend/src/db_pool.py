@@ -0,0 +1,151 @@
+"""Engine options, pool telemetry and sampled SQL logging
+
+Pool sizing, recycling, pre-ping and the statement timeout come from the
+environment and apply to every engine (primary, replicas, sync and async).
+Pools record how long checkouts take, i.e. waiting for a free connection or
+opening a new one, for /debug/pools.
+
+SQL statements are no longer echoed: a fraction SQL_LOG_SAMPLE_RATE of them
+is logged with its duration on the "supersub.sql" logger, whose records are
+written to stdout by a background thread instead of the request's.
+"""
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+from sqlalchemy import Engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+load_dotenv()
+
+# Per engine and per worker process: size the database's max_connections accordingly
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# 0 disables the timeout (PostgreSQL only)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+SQL_LOG_SAMPLE_RATE = float(os.getenv("SQL_LOG_SAMPLE_RATE", "0"))
+
+
+class WaitStats:
+    """Count and duration of connection checkouts"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "checkouts": self.count,
+            "wait_avg_ms": round(self.total_seconds / self.count * 1000, 3) if self.count else 0.0,
+            "wait_max_ms": round(self.max_seconds * 1000, 3),
+        }
+
+
+class _TimedPool:
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.waits = WaitStats()
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.waits.record(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, is_async: bool = False) -> Dict[str, Any]:
+    """Keyword arguments of create_engine / create_async_engine for `url`"""
+    options: Dict[str, Any] = {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    parsed = make_url(url)
+    if DB_STATEMENT_TIMEOUT_MS > 0 and parsed.get_backend_name() == "postgresql":
+        if parsed.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+def pool_status(engine: Engine) -> Dict[str, Any]:
+    """Usage of the connection pool of `engine` in this worker"""
+    pool = engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # QueuePool counts down from -size while the pool fills up
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": pool._max_overflow,
+    }
+    waits = getattr(pool, "waits", None)
+    if waits is not None:
+        status.update(waits.as_dict())
+    return status
+
+
+sql_logger = logging.getLogger("supersub.sql")
+_log_listener = None
+
+
+def install_sql_logging(engine: Engine) -> None:
+    """Log a sample of the statements run by `engine` (no-op unless SQL_LOG_SAMPLE_RATE > 0)"""
+    global _log_listener
+    if SQL_LOG_SAMPLE_RATE <= 0:
+        return
+    if _log_listener is None:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        sql_logger.addHandler(QueueHandler(log_queue))
+        sql_logger.setLevel(logging.INFO)
+        sql_logger.propagate = False
+        _log_listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+        _log_listener.start()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        if random.random() < SQL_LOG_SAMPLE_RATE:
+            context._sql_log_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _log(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_sql_log_start", None)
+        if start is not None:
+            sql_logger.info("%.2f ms %s", (time.perf_counter() - start) * 1000, statement)
+
+
+def stop_sql_logging() -> None:
+    """Write out the pending log records"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
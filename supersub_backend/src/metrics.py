@@ -0,0 +1,223 @@
+"""Prometheus metrics: request latency, database queries, Redis commands, caches
+
+Metrics live in the memory of each worker and are rendered in the Prometheus
+text format by GET /metrics, so every worker is a separate target (scrape
+them individually or run a single worker per container). Recording a value
+is a bucket lookup and a few increments under an uncontended lock; requests
+are labelled with their route template, never the raw path, to keep the
+number of series bounded.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import Engine, event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+_metrics: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {value}" for labels, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+        # labels -> per-bucket counts (the last one is +Inf), sum
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        # Counts are per bucket here and made cumulative when rendered
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+        lines = []
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(
+                    f"{self.name}_bucket{_format_labels((*self.label_names, 'le'), (*labels, le))} {cumulative}"
+                )
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {counts[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read when scraped, `collect` returns labels -> value"""
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str],
+        collect: Callable[[], Dict[Labels, float]]
+    ):
+        super().__init__(name, documentation, label_names)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+            for labels, value in self.collect().items()
+        ]
+
+
+class CollectedCounter(Gauge):
+    """Counter kept by another object and read when scraped"""
+    kind = "counter"
+
+
+def render() -> str:
+    """Every metric of this worker in the Prometheus text format"""
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
+
+
+http_requests = Counter(
+    "http_requests_total", "HTTP responses by route and status", ("method", "route", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to serve HTTP requests", ("method", "route")
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "Time spent in database statements", ("engine",)
+)
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds", "Round trip of Redis commands and pipelines", ("command",)
+)
+password_hashing_duration = Histogram(
+    "password_hashing_duration_seconds", "bcrypt hashing and verification, queueing included", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+# Cache name -> stats() of the cache: size, max_size, hits and misses
+_caches: Dict[str, Callable[[], Dict[str, int]]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, int]]) -> None:
+    """Export the hits, misses and size of a cache under the cache="<name>" label"""
+    _caches[name] = stats
+
+
+def _cache_values(key: str) -> Dict[Labels, float]:
+    return {(name,): stats()[key] for name, stats in _caches.items()}
+
+
+CollectedCounter("cache_hits_total", "Lookups answered by an in-process cache", ("cache",), lambda: _cache_values("hits"))
+CollectedCounter("cache_misses_total", "Lookups missed by an in-process cache", ("cache",), lambda: _cache_values("misses"))
+Gauge("cache_entries", "Entries held by an in-process cache", ("cache",), lambda: _cache_values("size"))
+Gauge("cache_max_entries", "Capacity of an in-process cache", ("cache",), lambda: _cache_values("max_size"))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            # Unmatched paths (404s, scans) share one series
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_duration.observe((method, template), elapsed)
+            http_requests.inc((method, template, str(status)))
+
+
+def install_query_metrics(engine: Engine, name: str) -> None:
+    """Time every statement run by `engine` under the engine="<name>" label"""
+    labels = (name,)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        db_query_duration.observe(labels, time.perf_counter() - context._metrics_start)
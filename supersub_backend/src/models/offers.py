@@ -43,6 +43,20 @@ class OffersRead(OffersBase):
     access_rules: List[AccessRules] = []
 
 
+class OffersPage(SQLModel):
+    """A page of offers and the cursor of the next page (None on the last page)"""
+    items: List[OffersRead]
+    next_cursor: Optional[str] = None
+
+
+class OfferStats(SQLModel):
+    """Number of users currently on an offer, and of users whose previous offer it is"""
+    offer_id: int
+    title: str
+    active_subscribers: int = 0
+    previous_subscribers: int = 0
+
+
 class OffersUpdate(SQLModel):
     title: Optional[str] = Field(default=None, max_length=255)
     description: Optional[str] = None
@@ -0,0 +1,16 @@
+from datetime import datetime
+
+from sqlmodel import SQLModel, Field
+
+
+class SchemaVersion(SQLModel, table=True):
+    """Single row recording which schema and seed data the database has
+
+    Startup compares `version` with the fingerprint of the models and only
+    creates tables, columns, indexes and seed rows when they differ.
+    """
+    __tablename__ = "schema_version"
+
+    id: int = Field(default=1, primary_key=True)
+    version: str
+    applied_at: datetime
@@ -0,0 +1,53 @@
+import uuid
+from datetime import date, datetime
+from enum import Enum
+from typing import Optional
+
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
+
+
+class SubscriptionEventKind(str, Enum):
+    SUBSCRIBE = "SUBSCRIBE"      # From no current offer
+    SWITCH = "SWITCH"            # From one current offer to another
+    UNSUBSCRIBE = "UNSUBSCRIBE"
+
+
+class SubscriptionEventsBase(SQLModel):
+    user_id: int
+    from_offer_id: Optional[int] = None
+    to_offer_id: Optional[int] = None
+    kind: SubscriptionEventKind
+    created_at: datetime
+
+
+class SubscriptionEvents(SubscriptionEventsBase, table=True):
+    """Append-only log of subscription changes
+
+    On PostgreSQL the table is partitioned by month of created_at, which has
+    to be part of the primary key. Events reference users and offers without
+    foreign keys so that the history outlives them.
+    """
+    __tablename__ = "subscription_events"
+    __table_args__ = (
+        Index("ix_subscription_events_user_id_created_at", "user_id", "created_at"),
+        Index("ix_subscription_events_to_offer_id_created_at", "to_offer_id", "created_at"),
+        Index("ix_subscription_events_from_offer_id_created_at", "from_offer_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    created_at: datetime = Field(primary_key=True)
+
+
+class SubscriptionEventRead(SubscriptionEventsBase):
+    id: uuid.UUID
+
+
+class OfferDailyFlow(SQLModel):
+    """Subscription changes into and out of an offer on one day"""
+    day: date
+    subscribed: int = 0     # SUBSCRIBE to the offer
+    switched_in: int = 0    # SWITCH from another offer
+    switched_out: int = 0   # SWITCH to another offer
+    unsubscribed: int = 0   # UNSUBSCRIBE from the offer
@@ -1,5 +1,6 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
-from typing import Optional, TYPE_CHECKING
+from typing import List, Optional, TYPE_CHECKING
 from enum import Enum
 
 if TYPE_CHECKING:
@@ -12,6 +13,11 @@ class GenderType(str, Enum):
     NON_BINARY = "NON_BINARY"
 
 
+class UsersFileFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
 class UsersBase(SQLModel):
     email: str = Field(max_length=255, unique=True)
     firstname: str = Field(max_length=100)
@@ -22,6 +28,14 @@ class UsersBase(SQLModel):
 
 
 class Users(UsersBase, table=True):
+    # Keyset pages filtered by offer walk this index in id order; with the
+    # previous_offer_id one, it also serves per-offer counts and the foreign
+    # key checks of offer deletes
+    __table_args__ = (
+        Index("ix_users_offer_id_id", "offer_id", "id"),
+        Index("ix_users_previous_offer_id", "previous_offer_id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     
     # Many-to-one relationship with offers (nullable)
@@ -32,6 +46,12 @@ class Users(UsersBase, table=True):
     previous_offer_id: Optional[int] = Field(default=None, foreign_key="offers.id")
     previous_offer: Optional["Offers"] = Relationship(sa_relationship_kwargs={"foreign_keys": "[Users.previous_offer_id]"})
 
+    # Embedded in access tokens; bumping it revokes every token issued before
+    token_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+    # Bumped by every write to the profile (fields, offers), part of the /auth/me ETag
+    row_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
 
 class UsersCreate(UsersBase):
     pass
@@ -51,6 +71,26 @@ class UsersRead(SQLModel):
     # Note: password is excluded from read model for security
 
 
+class UsersPage(SQLModel):
+    """A page of users and the cursor of the next page (None on the last page)"""
+    items: List[UsersRead]
+    next_cursor: Optional[str] = None
+
+
+class UsersImportError(SQLModel):
+    """A row rejected by a bulk import (rows are numbered from 1)"""
+    row: int
+    email: Optional[str] = None
+    detail: str
+
+
+class UsersImportReport(SQLModel):
+    total: int = 0
+    imported: int = 0
+    failed: int = 0
+    errors: List[UsersImportError] = []  # Truncated to the first rejected rows
+
+
 class UsersUpdate(SQLModel):
     email: Optional[str] = Field(default=None, max_length=255)
     firstname: Optional[str] = Field(default=None, max_length=100)
@@ -59,4 +99,9 @@ class UsersUpdate(SQLModel):
     gender: Optional[GenderType] = None
     password: Optional[str] = Field(default=None, max_length=255)
     offer_id: Optional[int] = None
-    previous_offer_id: Optional[int] = None
\ No newline at end of file
+    previous_offer_id: Optional[int] = None
+
+# Resolve the "Offers" forward references of the read model (no import cycle: offers does not import users)
+from .offers import Offers  # noqa: E402
+UsersRead.model_rebuild()
+UsersPage.model_rebuild()
@@ -0,0 +1,113 @@
+"""Per-offer subscriber counters
+
+Active (users.offer_id) and previous (users.previous_offer_id) subscriber
+counts are kept in two Redis hashes, offer id -> count. Every write path that
+moves users between offers reports the (offer_id, previous_offer_id) states
+it changed, and the counters are adjusted with HINCRBY, so reading them costs
+one round trip whatever the number of users.
+
+Increments are best effort (a worker can die between the commit and the
+HINCRBY, Redis can be unreachable, and writes racing a reconciliation can be
+counted twice or not at all): the hashes are recomputed from the database at
+startup if missing and then every OFFER_STATS_RECONCILE_SECONDS, by a single
+worker at a time.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+
+import redis
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlmodel import select
+
+from .database import session_scope
+from .models.users import Users
+from .redis_client import redis_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_KEY = "offers:stats:active"
+PREVIOUS_KEY = "offers:stats:previous"
+RECONCILE_LOCK_KEY = "offers:stats:reconciling"
+OFFER_STATS_RECONCILE_SECONDS = float(os.getenv("OFFER_STATS_RECONCILE_SECONDS", "300"))
+
+# (offer_id, previous_offer_id) of a user
+UserState = Tuple[Optional[int], Optional[int]]
+
+
+async def record_changes(changes: Iterable[Tuple[UserState, UserState]]) -> None:
+    """Apply (old state, new state) changes of committed writes to the counters"""
+    active: Counter = Counter()
+    previous: Counter = Counter()
+    for (old_offer_id, old_previous_id), (new_offer_id, new_previous_id) in changes:
+        active[old_offer_id] -= 1
+        active[new_offer_id] += 1
+        previous[old_previous_id] -= 1
+        previous[new_previous_id] += 1
+
+    increments = [
+        (key, str(offer_id), delta)
+        for key, deltas in ((ACTIVE_KEY, active), (PREVIOUS_KEY, previous))
+        for offer_id, delta in deltas.items()
+        if offer_id is not None and delta
+    ]
+    if not increments:
+        return
+    pipeline = redis_client.pipeline(transaction=False)
+    for key, offer_id, delta in increments:
+        pipeline.hincrby(key, offer_id, delta)
+    try:
+        await pipeline.execute()
+    except redis.RedisError as e:
+        logger.warning("Could not update offer counters, they are fixed by the next reconciliation: %s", e)
+
+
+async def reconcile() -> None:
+    """Recompute both hashes from the database"""
+    counts = {}
+    async with session_scope() as session:
+        for key, column in ((ACTIVE_KEY, Users.offer_id), (PREVIOUS_KEY, Users.previous_offer_id)):
+            # Served by the indexes on the offer columns
+            statement = select(column, func.count()).where(column.is_not(None)).group_by(column)
+            counts[key] = {str(offer_id): count for offer_id, count in (await session.exec(statement)).all()}
+
+    pipeline = redis_client.pipeline(transaction=True)
+    for key, values in counts.items():
+        pipeline.delete(key)
+        if values:
+            pipeline.hset(key, mapping=values)
+    await pipeline.execute()
+
+
+async def read_counts() -> Dict[str, Dict[int, int]]:
+    """Active and previous subscriber counts by offer id"""
+    active, previous = await asyncio.gather(redis_client.hgetall(ACTIVE_KEY), redis_client.hgetall(PREVIOUS_KEY))
+    return {
+        "active": {int(offer_id): int(count) for offer_id, count in active.items()},
+        "previous": {int(offer_id): int(count) for offer_id, count in previous.items()},
+    }
+
+
+async def run() -> None:
+    """Reconcile the counters now if they are missing, then periodically, until cancelled"""
+    try:
+        # Both hashes are needed: one alone may have been evicted or half-deleted
+        if await redis_client.exists(ACTIVE_KEY, PREVIOUS_KEY) < 2:
+            await reconcile()
+    except Exception:
+        # Keep running: the periodic reconciliation retries
+        logger.exception("Could not initialize offer counters")
+
+    while True:
+        await asyncio.sleep(OFFER_STATS_RECONCILE_SECONDS)
+        try:
+            # Expires on its own if the worker holding it dies
+            if await redis_client.set(RECONCILE_LOCK_KEY, "1", nx=True, ex=max(1, int(OFFER_STATS_RECONCILE_SECONDS))):
+                await reconcile()
+        except Exception:
+            logger.exception("Offer counters reconciliation failed")
@@ -0,0 +1,33 @@
+"""Keyset (cursor) pagination helpers
+
+Cursors are opaque to clients: they encode the id of the last row returned,
+and the next page starts right after it (`WHERE id > :last_id ORDER BY id`),
+which costs the same at page 1 and page 10,000.
+"""
+import base64
+import json
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(last_id: int) -> str:
+    """Build the cursor pointing right after `last_id`"""
+    payload = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Return the last id encoded in `cursor` (None for the first page)"""
+    if not cursor:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return int(json.loads(payload)["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
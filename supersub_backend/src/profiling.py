@@ -0,0 +1,218 @@
+"""Opt-in per-request profiling
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` or, with
+PROFILE_SAMPLE_RATE > 0, at random. Profiled responses get a Server-Timing
+header splitting the time to the response into db, redis, bcrypt, jwt and
+app (everything else: handlers, validation, serialization).
+
+Requests sent with the token are also traced in full: every SQL statement
+with its parameters and duration, and a cProfile call tree, dumped to
+PROFILE_DIR as <id>.txt (readable report) and <id>.prof (pstats, for
+snakeviz and the like); the id is returned in X-Profile-Id. Serialization
+then gets its own Server-Timing entry, taken from the call tree.
+
+The call tree only covers the event loop thread, so with DATABASE_ASYNC off
+the queries themselves show up in the SQL list but not in the tree. Other
+requests running concurrently on the loop are profiled too, and one request
+at a time per worker gets a call tree. Dumps contain query parameters: keep
+PROFILE_TOKEN secret and PROFILE_DIR private.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import Engine, event
+from starlette.concurrency import run_in_threadpool
+
+load_dotenv()
+
+PROFILE_HEADER = b"x-profile"
+# Empty disables profiling by header
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Characters of the parameters kept per statement in the dumps
+PROFILE_MAX_PARAMETERS_LENGTH = 2000
+
+CATEGORIES = ("db", "redis", "bcrypt", "jwt")
+
+
+class RequestProfile:
+    def __init__(self, full: bool):
+        self.timings: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+        # (duration in seconds, statement, parameters) of full profiles
+        self.statements: Optional[List[Tuple[float, str, str]]] = [] if full else None
+        self.profiler: Optional[cProfile.Profile] = None
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+_profiler_busy = False
+
+
+def record(category: str, seconds: float) -> None:
+    """Add time spent in `category` to the profile of the current request, if any"""
+    profile = _current.get()
+    if profile is not None:
+        profile.timings[category] += seconds
+        profile.counts[category] += 1
+
+
+def install_query_profiling(engine: Engine) -> None:
+    """Time the statements of `engine` for profiled requests (and keep them for full profiles)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            context._profile_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        start = getattr(context, "_profile_start", None)
+        if profile is None or start is None:
+            return
+        elapsed = time.perf_counter() - start
+        profile.timings["db"] += elapsed
+        profile.counts["db"] += 1
+        if profile.statements is not None:
+            profile.statements.append((elapsed, statement, repr(parameters)[:PROFILE_MAX_PARAMETERS_LENGTH]))
+
+
+def _requested_full(scope) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return hmac.compare_digest(value, PROFILE_TOKEN.encode())
+    return False
+
+
+def _profile_id(scope) -> str:
+    path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{scope['method']}-{path}-{uuid.uuid4().hex[:8]}"
+
+
+def _serialization_seconds(stats: pstats.Stats) -> float:
+    for (filename, _, function), (_, _, _, cumulative, _) in stats.stats.items():
+        if function == "serialize_response" and filename.endswith(os.path.join("fastapi", "routing.py")):
+            return cumulative
+    return 0.0
+
+
+def _server_timing(profile: RequestProfile, total: float, serialization: Optional[float]) -> str:
+    entries = []
+    accounted = 0.0
+    for category in CATEGORIES:
+        if category in profile.timings:
+            seconds = profile.timings[category]
+            accounted += seconds
+            entries.append(f'{category};dur={seconds * 1000:.2f};desc="{profile.counts[category]} calls"')
+    if serialization is not None:
+        accounted += serialization
+        entries.append(f"serialization;dur={serialization * 1000:.2f}")
+    # What remains: handler code, validation and, without a call tree, serialization
+    entries.append(f"app;dur={max(0.0, total - accounted) * 1000:.2f}")
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def _dump(
+    profile_id: str,
+    scope,
+    status: int,
+    server_timing: str,
+    profile: RequestProfile,
+    stats: Optional[pstats.Stats]
+) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+    with open(f"{base}.txt", "w", encoding="utf-8") as report:
+        query = scope.get("query_string", b"").decode("latin-1")
+        report.write(f"{scope['method']} {scope['path']}{'?' + query if query else ''} -> {status}\n")
+        report.write(f"Server-Timing: {server_timing}\n\n")
+        report.write(f"{len(profile.statements or [])} SQL statements\n")
+        for elapsed, statement, parameters in profile.statements or []:
+            report.write(f"\n-- {elapsed * 1000:.2f} ms\n{statement}\n-- parameters: {parameters}\n")
+        if stats is not None:
+            report.write("\nCall tree (event loop thread), by cumulative time\n")
+            stats.stream = report
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(80)
+    if stats is not None:
+        stats.dump_stats(f"{base}.prof")
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware profiling requests opted in by header or sampling"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _profiler_busy
+        if scope["type"] != "http" or (not PROFILE_TOKEN and PROFILE_SAMPLE_RATE <= 0):
+            await self.app(scope, receive, send)
+            return
+
+        full = _requested_full(scope)
+        if not full and random.random() >= PROFILE_SAMPLE_RATE:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(full)
+        profile_id = _profile_id(scope)
+        if full and not _profiler_busy:
+            profile.profiler = cProfile.Profile()
+            try:
+                profile.profiler.enable()
+                _profiler_busy = True
+            except ValueError:
+                # Another profiler (debugger, coverage...) is active
+                profile.profiler = None
+        stats: Optional[pstats.Stats] = None
+        status = 500
+        server_timing = ""
+
+        async def send_wrapper(message):
+            global _profiler_busy
+            nonlocal stats, status, server_timing
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - start
+                serialization = None
+                if profile.profiler is not None:
+                    profile.profiler.disable()
+                    _profiler_busy = False
+                    stats = pstats.Stats(profile.profiler, stream=io.StringIO())
+                    serialization = _serialization_seconds(stats)
+                status = message["status"]
+                server_timing = _server_timing(profile, total, serialization)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing.encode()))
+                if full:
+                    headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if profile.profiler is not None and stats is None:
+                # No response was started (unhandled error)
+                profile.profiler.disable()
+                _profiler_busy = False
+        if full:
+            await run_in_threadpool(_dump, profile_id, scope, status, server_timing, profile, stats)
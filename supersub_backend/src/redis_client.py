@@ -0,0 +1,143 @@
+"""Shared Redis connection (token revocation, cache invalidation)
+
+Commands go through a circuit breaker: after REDIS_BREAKER_FAILURES
+consecutive connection errors or timeouts they fail at once with
+CircuitOpenError (a redis ConnectionError, so the usual `except
+redis.RedisError` fallbacks apply) instead of each waiting out the timeouts.
+`monitor_circuit` pings Redis to close the circuit again once it answers.
+"""
+import os
+import time
+from typing import Any, Dict
+
+import redis.asyncio
+from dotenv import load_dotenv
+from redis.asyncio.client import Pipeline
+
+from . import metrics, profiling
+from .circuit_breaker import CircuitBreaker
+from .db_pool import WaitStats
+
+load_dotenv()
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+# Per worker process; commands wait up to REDIS_POOL_TIMEOUT seconds for a free connection
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "2"))
+# Commands take well under a millisecond: a slow Redis is treated as down
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.25"))
+# Idle connections are pinged before reuse after this many seconds
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+# Consecutive failures opening the circuit, seconds before a trial command,
+# and how often the circuit is probed while not closed
+REDIS_BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", "5"))
+REDIS_BREAKER_RESET_SECONDS = float(os.getenv("REDIS_BREAKER_RESET_SECONDS", "5"))
+REDIS_BREAKER_PROBE_SECONDS = float(os.getenv("REDIS_BREAKER_PROBE_SECONDS", "1"))
+
+
+class CircuitOpenError(redis.asyncio.ConnectionError):
+    """Raised without contacting Redis while its circuit is open"""
+
+
+redis_breaker = CircuitBreaker(
+    "redis",
+    failure_threshold=REDIS_BREAKER_FAILURES,
+    reset_seconds=REDIS_BREAKER_RESET_SECONDS,
+    failure_types=(redis.asyncio.ConnectionError, redis.asyncio.TimeoutError),
+    open_error=CircuitOpenError,
+)
+
+
+class TimedBlockingConnectionPool(redis.asyncio.BlockingConnectionPool):
+    """Blocking pool recording how long commands wait for a connection"""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.waits = WaitStats()
+
+    async def get_connection(self, *args: Any, **kwargs: Any):
+        start = time.perf_counter()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        finally:
+            self.waits.record(time.perf_counter() - start)
+
+
+class TimedPipeline(Pipeline):
+    async def execute(self, *args: Any, **kwargs: Any):
+        start = time.perf_counter()
+        try:
+            return await redis_breaker.call(super().execute, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.redis_command_duration.observe(("PIPELINE",), elapsed)
+            profiling.record("redis", elapsed)
+
+
+class TimedRedis(redis.asyncio.Redis):
+    """Client recording the round trip of every command and pipeline, behind the circuit breaker"""
+
+    async def execute_command(self, *args: Any, **options: Any):
+        start = time.perf_counter()
+        try:
+            return await redis_breaker.call(super().execute_command, *args, **options)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.redis_command_duration.observe((str(args[0]).upper(),), elapsed)
+            profiling.record("redis", elapsed)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Any = None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+redis_pool = TimedBlockingConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    decode_responses=True
+)
+
+redis_client = TimedRedis(connection_pool=redis_pool)
+# Sends the health probes, which the breaker lets through itself
+_probe_client = redis.asyncio.Redis(connection_pool=redis_pool)
+
+# Pub/sub subscriptions block on reads between messages: they get their own
+# connection without the socket timeout
+pubsub_client = redis.asyncio.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    decode_responses=True
+)
+
+
+async def monitor_circuit() -> None:
+    """Probe Redis while the circuit is not closed, until cancelled"""
+    await redis_breaker.monitor(_probe_client.ping, REDIS_BREAKER_PROBE_SECONDS)
+
+
+def pool_status() -> Dict[str, Any]:
+    """Usage of the Redis connection pool in this worker, and the state of its circuit"""
+    return {
+        "max_connections": redis_pool.max_connections,
+        "in_use": len(redis_pool._in_use_connections),
+        "available": len(redis_pool._available_connections),
+        **redis_pool.waits.as_dict(),
+        "circuit": redis_breaker.status(),
+    }
+
+
+metrics.Gauge(
+    "redis_pool_in_use", "Redis connections in use", (),
+    lambda: {(): len(redis_pool._in_use_connections)},
+)
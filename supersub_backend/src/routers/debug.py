@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+
+from .. import redis_client
+from ..database import pool_statuses
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+@router.get("/pools")
+async def read_pools():
+    """Connection pool usage of the worker serving the request (database engines and Redis)"""
+    return {"database": pool_statuses(), "redis": redis_client.pool_status()}
@@ -1,48 +1,101 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-from typing import List
+import json
+import redis
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional
 
+from .. import offer_stats
+from ..catalog import offer_catalog
+from ..conditional import json_response
 from ..database import get_session
-from ..models.offers import Offers, OffersCreate, OffersRead, OffersUpdate
+from ..models.offers import Offers, OfferStats, OffersCreate, OffersPage, OffersRead, OffersUpdate
+from ..pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/offers", tags=["offers"])
 
 
+async def get_offer_with_rules(session: AsyncSession, offer_id: int) -> Optional[Offers]:
+    """Load an offer together with its access rules"""
+    return await session.get(
+        Offers,
+        offer_id,
+        options=[selectinload(Offers.access_rules)],
+        populate_existing=True
+    )
+
+
 @router.post("/", response_model=OffersRead)
-def create_offer(offer: OffersCreate, session: Session = Depends(get_session)):
+async def create_offer(offer: OffersCreate, session: AsyncSession = Depends(get_session)):
     """Create a new offer"""
     db_offer = Offers.model_validate(offer)
     session.add(db_offer)
-    session.commit()
-    session.refresh(db_offer)
-    return db_offer
+    await session.commit()
+    await offer_catalog.invalidate()
+    return await get_offer_with_rules(session, db_offer.id)
 
 
 @router.get("/", response_model=List[OffersRead])
-def read_offers(skip: int = 0, limit: int = 100, session: Session = Depends(get_session)):
+async def read_offers(request: Request, skip: int = 0, limit: int = 100):
     """Get all offers"""
-    statement = select(Offers).offset(skip).limit(limit)
-    offers = session.exec(statement).all()
-    return offers
+    # Served from the in-memory catalog, already serialized
+    catalog = await offer_catalog.get()
+    return json_response(request, catalog.etag, catalog.page_json(skip, limit))
+
+
+@router.get("/page", response_model=OffersPage)
+async def read_offers_page(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE)
+):
+    """Get offers page by page, following `next_cursor`"""
+    catalog = await offer_catalog.get()
+    ids, has_more = catalog.ids_after(decode_cursor(cursor), limit)
+    next_cursor = encode_cursor(ids[-1]) if has_more else None
+    content = b'{"items":' + catalog.json_array(ids) + b',"next_cursor":' + json.dumps(next_cursor).encode() + b"}"
+    return json_response(request, catalog.etag, content)
+
+
+@router.get("/stats", response_model=List[OfferStats])
+async def read_offers_stats():
+    """Get the number of active and previous subscribers of every offer"""
+    # Counters maintained by the subscription writes, no scan of users
+    catalog = await offer_catalog.get()
+    try:
+        counts = await offer_stats.read_counts()
+    except redis.RedisError:
+        raise HTTPException(status_code=503, detail="Offer statistics unavailable")
+    return [
+        OfferStats(
+            offer_id=offer_id,
+            title=catalog.offers[offer_id].title,
+            active_subscribers=counts["active"].get(offer_id, 0),
+            previous_subscribers=counts["previous"].get(offer_id, 0)
+        )
+        for offer_id in catalog.ids
+    ]
 
 
 @router.get("/{offer_id}", response_model=OffersRead)
-def read_offer(offer_id: int, session: Session = Depends(get_session)):
+async def read_offer(request: Request, offer_id: int):
     """Get an offer by its ID"""
-    offer = session.get(Offers, offer_id)
-    if not offer:
+    catalog = await offer_catalog.get()
+    offer_json = catalog.offers_json.get(offer_id)
+    if offer_json is None:
         raise HTTPException(status_code=404, detail="Offer not found")
-    return offer
+    return json_response(request, catalog.offer_etags[offer_id], offer_json)
 
 
 @router.patch("/{offer_id}", response_model=OffersRead)
-def update_offer(
+async def update_offer(
     offer_id: int, 
     offer_update: OffersUpdate, 
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
     """Update an offer"""
-    offer = session.get(Offers, offer_id)
+    offer = await get_offer_with_rules(session, offer_id)
     if not offer:
         raise HTTPException(status_code=404, detail="Offer not found")
     
@@ -51,18 +104,19 @@ def update_offer(
         setattr(offer, field, value)
     
     session.add(offer)
-    session.commit()
-    session.refresh(offer)
-    return offer
+    await session.commit()
+    await offer_catalog.invalidate()
+    return await get_offer_with_rules(session, offer_id)
 
 
 @router.delete("/{offer_id}")
-def delete_offer(offer_id: int, session: Session = Depends(get_session)):
+async def delete_offer(offer_id: int, session: AsyncSession = Depends(get_session)):
     """Delete an offer"""
-    offer = session.get(Offers, offer_id)
+    offer = await session.get(Offers, offer_id)
     if not offer:
         raise HTTPException(status_code=404, detail="Offer not found")
     
-    session.delete(offer)
-    session.commit()
-    return {"message": "Offer deleted successfully"}
\ No newline at end of file
+    await session.delete(offer)
+    await session.commit()
+    await offer_catalog.invalidate()
+    return {"message": "Offer deleted successfully"}
@@ -1,79 +1,249 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-from typing import List
+import csv
+import io
+import json
+from enum import Enum
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
+from sqlalchemy.orm import joinedload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import AsyncIterator, List, Optional, Sequence
 
-from ..database import get_session
-from ..models.users import Users, UsersCreate, UsersRead, UsersUpdate
+from .. import offer_stats
+from ..auth.user_cache import user_cache
+from ..catalog import offer_catalog
+from ..database import get_session, stream_rows
+from ..models.users import (
+    Users, UsersCreate, UsersFileFormat, UsersImportReport, UsersPage, UsersRead, UsersUpdate
+)
+from ..users_import import import_users, parse_rows
+from ..pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor
+from ..serialization import FAST_RESPONSES, OrjsonResponse
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+# Relationships serialized by UsersRead: both are many-to-one, so they are
+# joined into the users query instead of costing one query per row
+USER_READ_OPTIONS = [joinedload(Users.offer), joinedload(Users.previous_offer)]
+
+
+# Columns of the bulk export, in output order
+EXPORT_COLUMNS = [
+    Users.id,
+    Users.email,
+    Users.firstname,
+    Users.lastname,
+    Users.age,
+    Users.gender,
+    Users.offer_id,
+    Users.previous_offer_id,
+]
+EXPORT_BATCH_SIZE = 5000
+
+# Columns of UsersRead, in output order, for the fast response mode
+USER_READ_COLUMNS = [
+    Users.id,
+    Users.email,
+    Users.firstname,
+    Users.lastname,
+    Users.age,
+    Users.gender,
+    Users.offer_id,
+    Users.previous_offer_id,
+]
+
+
+async def get_user_with_offers(session: AsyncSession, user_id: int) -> Optional[Users]:
+    """Load a user together with its current and previous offers"""
+    return await session.get(Users, user_id, options=USER_READ_OPTIONS, populate_existing=True)
+
+
+async def user_read_dicts(rows: Sequence[Row]) -> List[dict]:
+    """UsersRead dicts of USER_READ_COLUMNS rows, offers taken from the catalog"""
+    catalog = await offer_catalog.get()
+    offer_ids = {offer_id for row in rows for offer_id in (row.offer_id, row.previous_offer_id)}
+    if not offer_ids.issubset(catalog.offer_dicts.keys() | {None}):
+        # An offer created since the last reload
+        catalog = await offer_catalog.reload()
+    offers = catalog.offer_dicts
+    return [
+        {
+            "id": row.id,
+            "email": row.email,
+            "firstname": row.firstname,
+            "lastname": row.lastname,
+            "age": row.age,
+            "gender": row.gender,
+            "offer_id": row.offer_id,
+            "offer": offers.get(row.offer_id),
+            "previous_offer_id": row.previous_offer_id,
+            "previous_offer": offers.get(row.previous_offer_id),
+        }
+        for row in rows
+    ]
+
 
 @router.post("/", response_model=UsersRead)
-def create_user(user: UsersCreate, session: Session = Depends(get_session)):
+async def create_user(user: UsersCreate, session: AsyncSession = Depends(get_session)):
     """Create a new user"""
     # Check if email already exists
-    existing_user = session.exec(select(Users).where(Users.email == user.email)).first()
+    existing_user = (await session.exec(select(Users).where(Users.email == user.email))).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     db_user = Users.model_validate(user)
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
-    return db_user
+    await session.commit()
+    return await get_user_with_offers(session, db_user.id)
+
+
+@router.post("/import", response_model=UsersImportReport)
+async def import_users_file(file: UploadFile, format: UsersFileFormat = UsersFileFormat.CSV):
+    """Bulk import users from a CSV or NDJSON file of UsersCreate rows
+
+    Valid rows are imported even if others are rejected; the report lists
+    the rejected rows with the reason.
+    """
+    lines = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    return await import_users(parse_rows(lines, format))
 
 
 @router.get("/", response_model=List[UsersRead])
-def read_users(skip: int = 0, limit: int = 100, session: Session = Depends(get_session)):
+async def read_users(skip: int = 0, limit: int = 100, session: AsyncSession = Depends(get_session)):
     """Get all users"""
-    statement = select(Users).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    if FAST_RESPONSES:
+        statement = select(*USER_READ_COLUMNS).offset(skip).limit(limit)
+        rows = (await session.execute(statement)).all()
+        return OrjsonResponse(await user_read_dicts(rows))
+
+    statement = select(Users).options(*USER_READ_OPTIONS).offset(skip).limit(limit)
+    users = (await session.exec(statement)).all()
     return users
 
 
+@router.get("/page", response_model=UsersPage)
+async def read_users_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    offer_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Get users page by page, following `next_cursor` (optionally filtered by current offer)"""
+    if FAST_RESPONSES:
+        statement = select(*USER_READ_COLUMNS).order_by(Users.id)
+    else:
+        statement = select(Users).options(*USER_READ_OPTIONS).order_by(Users.id)
+    after_id = decode_cursor(cursor)
+    if after_id is not None:
+        statement = statement.where(Users.id > after_id)
+    if offer_id is not None:
+        statement = statement.where(Users.offer_id == offer_id)
+
+    # Fetch one extra row to know whether another page follows
+    statement = statement.limit(limit + 1)
+    if FAST_RESPONSES:
+        rows = (await session.execute(statement)).all()
+        next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+        return OrjsonResponse({"items": await user_read_dicts(rows[:limit]), "next_cursor": next_cursor})
+
+    users = (await session.exec(statement)).all()
+    next_cursor = encode_cursor(users[limit - 1].id) if len(users) > limit else None
+    return UsersPage(items=users[:limit], next_cursor=next_cursor)
+
+
+async def export_ndjson() -> AsyncIterator[bytes]:
+    names = [column.key for column in EXPORT_COLUMNS]
+    statement = select(*EXPORT_COLUMNS).order_by(Users.id)
+    async for rows in stream_rows(statement, EXPORT_BATCH_SIZE, read_only=True):
+        yield "".join(
+            json.dumps(dict(zip(names, row)), ensure_ascii=False, separators=(",", ":")) + "\n"
+            for row in rows
+        ).encode()
+
+
+async def export_csv() -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in EXPORT_COLUMNS])
+    statement = select(*EXPORT_COLUMNS).order_by(Users.id)
+    async for rows in stream_rows(statement, EXPORT_BATCH_SIZE, read_only=True):
+        writer.writerows(
+            [value.value if isinstance(value, Enum) else value for value in row] for row in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+@router.get("/export")
+async def export_users(format: UsersFileFormat = UsersFileFormat.NDJSON):
+    """Stream every user with its current and previous offer ids
+
+    Rows are read through a server-side cursor and written without model
+    validation, so memory stays constant whatever the number of users.
+    """
+    if format == UsersFileFormat.CSV:
+        content, media_type = export_csv(), "text/csv"
+    else:
+        content, media_type = export_ndjson(), "application/x-ndjson"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="users.{format.value}"'}
+    )
+
+
 @router.get("/{user_id}", response_model=UsersRead)
-def read_user(user_id: int, session: Session = Depends(get_session)):
+async def read_user(user_id: int, session: AsyncSession = Depends(get_session)):
     """Get a user by its ID"""
-    user = session.get(Users, user_id)
+    user = await get_user_with_offers(session, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
 @router.patch("/{user_id}", response_model=UsersRead)
-def update_user(
+async def update_user(
     user_id: int, 
     user_update: UsersUpdate, 
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
     """Update a user"""
-    user = session.get(Users, user_id)
+    user = await session.get(Users, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check if email is being updated and if it already exists
     if user_update.email and user_update.email != user.email:
-        existing_user = session.exec(select(Users).where(Users.email == user_update.email)).first()
+        existing_user = (await session.exec(select(Users).where(Users.email == user_update.email))).first()
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
     
+    state = (user.offer_id, user.previous_offer_id)
     user_data = user_update.model_dump(exclude_unset=True)
     for field, value in user_data.items():
         setattr(user, field, value)
+    # Incremented in SQL: concurrent subscription writes bump it too
+    user.row_version = Users.row_version + 1
     
     session.add(user)
-    session.commit()
-    session.refresh(user)
-    return user
+    await session.commit()
+    await user_cache.invalidate([user_id])
+    await offer_stats.record_changes([(state, (user.offer_id, user.previous_offer_id))])
+    return await get_user_with_offers(session, user_id)
 
 
 @router.delete("/{user_id}")
-def delete_user(user_id: int, session: Session = Depends(get_session)):
+async def delete_user(user_id: int, session: AsyncSession = Depends(get_session)):
     """Delete a user"""
-    user = session.get(Users, user_id)
+    user = await session.get(Users, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    session.delete(user)
-    session.commit()
-    return {"message": "User deleted successfully"}
\ No newline at end of file
+    state = (user.offer_id, user.previous_offer_id)
+    await session.delete(user)
+    await session.commit()
+    await user_cache.invalidate([user_id])
+    await offer_stats.record_changes([(state, (None, None))])
+    return {"message": "User deleted successfully"}
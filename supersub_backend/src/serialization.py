@@ -0,0 +1,28 @@
+"""Fast response mode for list endpoints
+
+By default list handlers return ORM objects that FastAPI validates against
+their response_model (nested offers included) before encoding them. With
+FAST_RESPONSES on, handlers that support it select plain row tuples, build
+the response dicts themselves (nested offers come pre-built from the
+catalog) and encode them with orjson, skipping the model validation. The
+response_model is kept on the route, so the OpenAPI schema is unchanged;
+the handler is responsible for producing the same JSON.
+"""
+import os
+from typing import Any
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import Response
+
+load_dotenv()
+
+FAST_RESPONSES = os.getenv("FAST_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+
+class OrjsonResponse(Response):
+    """JSON response encoded with orjson (enums by value, datetimes as ISO 8601)"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
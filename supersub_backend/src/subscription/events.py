@@ -0,0 +1,98 @@
+"""Write-behind buffer for the subscription event log
+
+Subscription handlers only append events to an in-process buffer; a
+background task (started in the app lifespan) inserts them in batches when
+EVENT_FLUSH_SIZE events are pending or every EVENT_FLUSH_INTERVAL_SECONDS,
+and once more at shutdown. The history therefore lags the writes by up to
+the flush interval, and events still buffered when a worker is killed are
+lost: the log is meant for analytics, users.offer_id stays the source of
+truth.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+from starlette.concurrency import run_in_threadpool
+
+from ..database import ensure_event_partitions, session_scope
+from ..models.subscription_events import SubscriptionEventKind, SubscriptionEvents
+
+logger = logging.getLogger(__name__)
+
+EVENT_FLUSH_SIZE = int(os.getenv("EVENT_FLUSH_SIZE", "500"))
+EVENT_FLUSH_INTERVAL_SECONDS = float(os.getenv("EVENT_FLUSH_INTERVAL_SECONDS", "1.0"))
+# Events kept while the database is unreachable; the oldest are dropped beyond
+EVENT_BUFFER_MAX_SIZE = int(os.getenv("EVENT_BUFFER_MAX_SIZE", "100000"))
+
+
+class EventBuffer:
+    def __init__(self):
+        self._events: List[Dict] = []
+        self._full = asyncio.Event()
+        self._partitions_month: Optional[date] = None
+        self.dropped = 0
+
+    def record(
+        self,
+        user_id: int,
+        from_offer_id: Optional[int],
+        to_offer_id: Optional[int],
+        kind: SubscriptionEventKind
+    ) -> None:
+        """Queue an event; it is written by the next flush"""
+        self._events.append({
+            "id": uuid.uuid4(),
+            "user_id": user_id,
+            "from_offer_id": from_offer_id,
+            "to_offer_id": to_offer_id,
+            "kind": kind,
+            "created_at": datetime.now(timezone.utc),
+        })
+        if len(self._events) >= EVENT_FLUSH_SIZE:
+            self._full.set()
+
+    async def flush(self) -> None:
+        """Insert every pending event in one statement"""
+        events, self._events = self._events, []
+        self._full.clear()
+        if not events:
+            return
+        try:
+            async with session_scope() as session:
+                await session.execute(insert(SubscriptionEvents), events)
+                await session.commit()
+        except Exception:
+            logger.exception("Could not write %d subscription events, keeping them for the next flush", len(events))
+            self._events = events + self._events
+            overflow = len(self._events) - EVENT_BUFFER_MAX_SIZE
+            if overflow > 0:
+                del self._events[:overflow]
+                self.dropped += overflow
+                logger.warning("Dropped %d subscription events", overflow)
+
+    async def _ensure_partitions(self) -> None:
+        # Partitions are created ahead: once per month and worker is enough
+        month = date.today().replace(day=1)
+        if month != self._partitions_month:
+            await run_in_threadpool(ensure_event_partitions)
+            self._partitions_month = month
+
+    async def run(self) -> None:
+        """Flush on size or time until cancelled, then flush what is left"""
+        try:
+            while True:
+                await self._ensure_partitions()
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=EVENT_FLUSH_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+        finally:
+            await self.flush()
+
+
+event_buffer = EventBuffer()
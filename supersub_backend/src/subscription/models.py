@@ -1,5 +1,6 @@
 from sqlmodel import SQLModel
-from typing import Optional
+from typing import List, Optional
+from enum import Enum
 
 
 class SubscribeRequest(SQLModel):
@@ -25,4 +26,42 @@ class UnsubscribeResponse(SQLModel):
     message: str
     user_id: int
     previous_offer_id: int
-    previous_offer_title: str
\ No newline at end of file
+    previous_offer_title: str
+
+
+class BatchAction(str, Enum):
+    SUBSCRIBE = "SUBSCRIBE"
+    UNSUBSCRIBE = "UNSUBSCRIBE"
+
+
+class BatchSubscriptionRequest(SQLModel):
+    """Request model for applying a subscription change to many users
+
+    Users are selected either by id or by their current offer. SUBSCRIBE
+    moves them to `offer_id` (subject to its access rules), UNSUBSCRIBE
+    removes `offer_id` from those currently subscribed to it.
+    """
+    offer_id: int
+    action: BatchAction = BatchAction.SUBSCRIBE
+    user_ids: Optional[List[int]] = None
+    from_offer_id: Optional[int] = None
+
+
+class BatchSubscriptionResponse(SQLModel):
+    """Response model for a batch subscription change"""
+    message: str
+    offer_id: int
+    matched: int  # Users found by the selector
+    changed: int
+    rejected: int  # Matched users refused by the access rules (or not subscribed, for UNSUBSCRIBE)
+
+
+class EligibleOffersBatchRequest(SQLModel):
+    """Request model for computing eligible offers of many users"""
+    user_ids: List[int]
+
+
+class UserEligibleOffers(SQLModel):
+    """Offers a user may subscribe to"""
+    user_id: int
+    offer_ids: List[int]
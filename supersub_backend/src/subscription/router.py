@@ -1,120 +1,402 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import Update, func, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from ..database import get_session
+from .. import offer_stats
+from ..catalog import offer_catalog
+from ..database import get_read_session, get_session
 from ..models.users import Users
-from ..models.offers import Offers
+from ..models.offers import OffersRead
+from ..models.subscription_events import (
+    OfferDailyFlow,
+    SubscriptionEventKind,
+    SubscriptionEventRead,
+    SubscriptionEvents,
+)
+from ..offer_stats import UserState
+from ..pagination import MAX_PAGE_SIZE
 from ..auth.dependencies import get_current_active_user
-from .models import SubscribeRequest, SubscribeResponse, UnsubscribeRequest, UnsubscribeResponse
+from ..auth.user_cache import user_cache
+from .models import (
+    BatchAction,
+    BatchSubscriptionRequest,
+    BatchSubscriptionResponse,
+    EligibleOffersBatchRequest,
+    SubscribeRequest,
+    SubscribeResponse,
+    UnsubscribeRequest,
+    UnsubscribeResponse,
+    UserEligibleOffers,
+)
+from .events import event_buffer
 
 router = APIRouter(prefix="/subscription", tags=["subscription"])
 
+# Users updated per statement (and per transaction) by batch operations
+BATCH_CHUNK_SIZE = 5000
+# Conditional UPDATEs tried before answering 409 when the user keeps changing
+MAX_SUBSCRIPTION_RETRIES = 5
 
-def is_offer_accessible(offer: Offers, current_user: Users) -> bool:
-    """Check if an offer is accessible based on access rules and current user state"""
-    # If no access rules, the offer is accessible to everyone
-    if not offer.access_rules or len(offer.access_rules) == 0:
-        return True
 
-    current_user_offer = current_user.offer
-    previous_user_offer = current_user.previous_offer
+@router.get("/eligible-offers", response_model=List[OffersRead])
+async def read_eligible_offers(current_user: Users = Depends(get_current_active_user)):
+    """Get the offers the current user may subscribe to"""
+    catalog = await offer_catalog.get()
+    offer_ids = catalog.access.eligible_offer_ids(current_user.offer_id, current_user.previous_offer_id)
+    return Response(content=catalog.json_array(offer_ids), media_type="application/json")
 
-    # Check each access rule
-    for rule in offer.access_rules:
-        if rule.access_type == "FIRST_SUB":
-            # Accessible if user has no current offer and no previous offer
-            if not current_user_offer and not previous_user_offer:
-                return True
-        elif rule.access_type == "RENEW_SUB":
-            # Accessible if user had this offer before (can renew)
-            if previous_user_offer and not current_user_offer:
-                return True
-        elif rule.access_type == "SWITCH_SUB":
-            # Accessible if user has a different current offer (switching)
-            if current_user_offer and current_user_offer.id != offer.id:
-                return True
 
-    # If no access rule matches, the offer is not accessible
-    return False
+@router.post("/eligible-offers/batch", response_model=List[UserEligibleOffers])
+async def read_eligible_offers_batch(
+    batch_request: EligibleOffersBatchRequest,
+    session: AsyncSession = Depends(get_read_session)
+):
+    """Get the offers each of the given users may subscribe to (admin)
+
+    A POST only to carry the list of users: it reads from a replica.
+    """
+    catalog = await offer_catalog.get()
+    user_ids = sorted(set(batch_request.user_ids))
+    eligible = {}
+    for start in range(0, len(user_ids), BATCH_CHUNK_SIZE):
+        statement = (
+            select(Users.id, Users.offer_id, Users.previous_offer_id)
+            .where(Users.id.in_(user_ids[start:start + BATCH_CHUNK_SIZE]))
+        )
+        eligible.update(catalog.access.eligible_offer_ids_many((await session.exec(statement)).all()))
+    return [
+        UserEligibleOffers(user_id=user_id, offer_ids=offer_ids)
+        for user_id, offer_ids in sorted(eligible.items())
+    ]
+
+
+def in_state(state: UserState) -> List[Any]:
+    """Conditions matching the users whose (offer_id, previous_offer_id) is `state`"""
+    return [
+        column.is_(None) if value is None else column == value
+        for column, value in zip((Users.offer_id, Users.previous_offer_id), state)
+    ]
+
+
+def subscribed_state(offer_id: int, state: UserState) -> UserState:
+    # Save current offer as previous offer (if user has one) and update to new offer
+    current_offer_id, previous_offer_id = state
+    return offer_id, current_offer_id if current_offer_id is not None else previous_offer_id
+
+
+def unsubscribed_state(state: UserState) -> UserState:
+    # Save current offer as previous offer and remove current offer
+    return None, state[0]
+
+
+def move_statement(state: UserState, new_state: UserState, *conditions: Any) -> Update:
+    """Move the users matching `conditions` from `state` to `new_state`
+
+    The expected state is part of the condition, so the UPDATE only applies
+    to rows nobody changed since it was read, without locking them; and the
+    old state of every updated row is known for the event log and counters.
+    """
+    return (
+        update(Users)
+        .where(*conditions, *in_state(state))
+        .values(offer_id=new_state[0], previous_offer_id=new_state[1], row_version=Users.row_version + 1)
+        .returning(Users.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def read_state(session: AsyncSession, user_id: int) -> Optional[UserState]:
+    row = (await session.execute(
+        select(Users.offer_id, Users.previous_offer_id).where(Users.id == user_id)
+    )).first()
+    return tuple(row) if row is not None else None
+
+
+def subscription_event(user_id: int, state: UserState, new_state: UserState) -> Tuple:
+    """Arguments of event_buffer.record for a user moved from `state` to `new_state`"""
+    if new_state[0] is None:
+        return user_id, state[0], None, SubscriptionEventKind.UNSUBSCRIBE
+    if state[0] is None:
+        return user_id, None, new_state[0], SubscriptionEventKind.SUBSCRIBE
+    return user_id, state[0], new_state[0], SubscriptionEventKind.SWITCH
+
+
+async def after_commit(changes: List[Tuple[int, UserState, UserState]]) -> None:
+    """Propagate committed (user_id, old state, new state) changes"""
+    await user_cache.invalidate([user_id for user_id, _, _ in changes])
+    await offer_stats.record_changes((state, new_state) for _, state, new_state in changes)
+    for change in changes:
+        event_buffer.record(*subscription_event(*change))
 
 
 @router.post("/subscribeTo", response_model=SubscribeResponse)
-def subscribe_to_offer(
+async def subscribe_to_offer(
     subscribe_request: SubscribeRequest,
     current_user: Users = Depends(get_current_active_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
-    """Subscribe current user to an offer"""
+    """Subscribe current user to an offer
+
+    The access rules are checked on the cached user and the change applied by
+    one conditional UPDATE that only matches the row in that same state: if a
+    concurrent request changed it, the current row is read and checked again.
+    """
     
-    # Check if the offer exists
-    offer = session.get(Offers, subscribe_request.offer_id)
+    # Check if the offer exists (the catalog holds offers with their access rules)
+    catalog = await offer_catalog.get()
+    offer = catalog.offers.get(subscribe_request.offer_id)
     if not offer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Offer not found"
         )
     
-    # Check if the user has access to this offer based on access rules
-    if not is_offer_accessible(offer, current_user):
+    state = (current_user.offer_id, current_user.previous_offer_id)
+    for _ in range(MAX_SUBSCRIPTION_RETRIES):
+        # Check if the user has access to this offer based on access rules
+        if catalog.access.is_accessible(offer.id, *state):
+            new_state = subscribed_state(offer.id, state)
+            statement = move_statement(state, new_state, Users.id == current_user.id)
+            if (await session.execute(statement)).first() is not None:
+                break
+        # The cached state is out of date, or denies access: check the current row
+        current_state = await read_state(session, current_user.id)
+        if current_state is None or current_state == state:
+            await session.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You do not have access to this offer based on the current access rules"
+            )
+        state = current_state
+    else:
+        await session.rollback()
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You do not have access to this offer based on the current access rules"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Your subscription is being changed concurrently, please retry"
         )
-    
-    # Save current offer as previous offer (if user has one) and update to new offer
-    if current_user.offer_id is not None:
-        current_user.previous_offer_id = current_user.offer_id
-    
-    current_user.offer_id = subscribe_request.offer_id
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+    await session.commit()
+    await after_commit([(current_user.id, state, new_state)])
     
     return SubscribeResponse(
         message="Successfully subscribed to offer",
-        user_id=current_user.id or 0,
-        offer_id=subscribe_request.offer_id,
+        user_id=current_user.id,
+        offer_id=offer.id,
         offer_title=offer.title
     )
 
 
 @router.post("/unsubscribeTo", response_model=UnsubscribeResponse)
-def unsubscribe_from_offer(
+async def unsubscribe_from_offer(
     unsubscribe_request: UnsubscribeRequest,
     current_user: Users = Depends(get_current_active_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
-    """Unsubscribe current user from an offer"""
+    """Unsubscribe current user from an offer, with a conditional UPDATE"""
     
-    # Check if the user currently has this offer
-    if current_user.offer_id != unsubscribe_request.offer_id:
+    state = (current_user.offer_id, current_user.previous_offer_id)
+    for _ in range(MAX_SUBSCRIPTION_RETRIES):
+        # Check if the user currently has this offer
+        if state[0] == unsubscribe_request.offer_id:
+            new_state = unsubscribed_state(state)
+            statement = move_statement(state, new_state, Users.id == current_user.id)
+            if (await session.execute(statement)).first() is not None:
+                break
+        current_state = await read_state(session, current_user.id)
+        if current_state is None or current_state == state:
+            await session.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="You are not currently subscribed to this offer"
+            )
+        state = current_state
+    else:
+        await session.rollback()
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You are not currently subscribed to this offer"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Your subscription is being changed concurrently, please retry"
         )
     
-    # Get the current offer details before removing it
-    current_offer = session.get(Offers, current_user.offer_id)
+    # Get the offer details for the response
+    catalog = await offer_catalog.get()
+    current_offer = catalog.offers.get(unsubscribe_request.offer_id)
     if not current_offer:
+        await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Current offer not found"
         )
     
-    # Store offer details for response
-    previous_offer_id = current_user.offer_id or 0  # Ensure it's not None
-    previous_offer_title = current_offer.title
-    
-    # Save current offer as previous offer and remove current offer
-    current_user.previous_offer_id = current_user.offer_id
-    current_user.offer_id = None
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+    await session.commit()
+    await after_commit([(current_user.id, state, new_state)])
     
     return UnsubscribeResponse(
         message="Successfully unsubscribed from offer",
-        user_id=current_user.id or 0,
-        previous_offer_id=previous_offer_id,
-        previous_offer_title=previous_offer_title
-    )
\ No newline at end of file
+        user_id=current_user.id,
+        previous_offer_id=current_offer.id,
+        previous_offer_title=current_offer.title
+    )
+
+
+async def selected_users(
+    batch_request: BatchSubscriptionRequest,
+    session: AsyncSession
+) -> AsyncIterator[List[Tuple[int, Optional[int], Optional[int]]]]:
+    """Yield (id, offer_id, previous_offer_id) of the selected users, chunk by chunk in id order"""
+    columns = select(Users.id, Users.offer_id, Users.previous_offer_id)
+    if batch_request.user_ids is not None:
+        user_ids = sorted(set(batch_request.user_ids))
+        for start in range(0, len(user_ids), BATCH_CHUNK_SIZE):
+            chunk = user_ids[start:start + BATCH_CHUNK_SIZE]
+            # Only keep existing users
+            yield list((await session.exec(columns.where(Users.id.in_(chunk)))).all())
+    else:
+        statement = columns.where(Users.offer_id == batch_request.from_offer_id).order_by(Users.id)
+        last_id = 0
+        while True:
+            chunk = list((await session.exec(
+                statement.where(Users.id > last_id).limit(BATCH_CHUNK_SIZE)
+            )).all())
+            if not chunk:
+                return
+            last_id = chunk[-1][0]
+            yield chunk
+
+
+@router.post("/batch", response_model=BatchSubscriptionResponse)
+async def batch_subscription(
+    batch_request: BatchSubscriptionRequest,
+    session: AsyncSession = Depends(get_session)
+):
+    """Subscribe or unsubscribe many users at once (admin)
+
+    Users of each chunk are grouped by (offer_id, previous_offer_id): access
+    rules are checked once per group, and each group is moved by a single
+    UPDATE ... RETURNING that skips users changed since the chunk was read.
+    There are at most a few groups per offer in the catalog.
+    """
+    if (batch_request.user_ids is None) == (batch_request.from_offer_id is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Select users with exactly one of user_ids or from_offer_id"
+        )
+
+    catalog = await offer_catalog.get()
+    offer = catalog.offers.get(batch_request.offer_id)
+    if not offer:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Offer not found"
+        )
+
+    matched = changed = 0
+    async for users in selected_users(batch_request, session):
+        matched += len(users)
+        by_state: Dict[UserState, List[int]] = {}
+        for user_id, offer_id, previous_offer_id in users:
+            by_state.setdefault((offer_id, previous_offer_id), []).append(user_id)
+
+        changes = []
+        for state, user_ids in by_state.items():
+            if batch_request.action == BatchAction.SUBSCRIBE:
+                if not catalog.access.is_accessible(offer.id, *state):
+                    continue
+                new_state = subscribed_state(offer.id, state)
+            else:
+                if state[0] != offer.id:
+                    continue
+                new_state = unsubscribed_state(state)
+            statement = move_statement(state, new_state, Users.id.in_(user_ids))
+            changes += [(user_id, state, new_state) for user_id in (await session.execute(statement)).scalars()]
+        await session.commit()
+        changed += len(changes)
+        await after_commit(changes)
+
+    return BatchSubscriptionResponse(
+        message=f"{batch_request.action.value} applied to {changed} users",
+        offer_id=offer.id,
+        matched=matched,
+        changed=changed,
+        rejected=matched - changed
+    )
+
+
+async def read_history(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    before: Optional[datetime]
+) -> List[SubscriptionEvents]:
+    statement = (
+        select(SubscriptionEvents)
+        .where(SubscriptionEvents.user_id == user_id)
+        .order_by(SubscriptionEvents.created_at.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        statement = statement.where(SubscriptionEvents.created_at < before)
+    return list((await session.exec(statement)).all())
+
+
+@router.get("/history", response_model=List[SubscriptionEventRead])
+async def read_my_history(
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[datetime] = None,
+    current_user: Users = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """Subscription changes of the current user, most recent first
+
+    Pass the created_at of the last event as `before` to get older ones.
+    """
+    return await read_history(session, current_user.id, limit, before)
+
+
+@router.get("/history/{user_id}", response_model=List[SubscriptionEventRead])
+async def read_user_history(
+    user_id: int,
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Subscription changes of any user, most recent first (admin)"""
+    return await read_history(session, user_id, limit, before)
+
+
+@router.get("/offers/{offer_id}/flows", response_model=List[OfferDailyFlow])
+async def read_offer_flows(
+    offer_id: int,
+    days: int = Query(default=30, ge=1, le=366),
+    session: AsyncSession = Depends(get_session)
+):
+    """Daily subscriptions into and out of an offer over the last `days` days (admin)"""
+    since = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    day = func.date(SubscriptionEvents.created_at)
+    flows: Dict[str, OfferDailyFlow] = {}
+
+    # One grouped query per direction, each served by its (offer, created_at) index
+    directions = [
+        (SubscriptionEvents.to_offer_id, {
+            SubscriptionEventKind.SUBSCRIBE: "subscribed",
+            SubscriptionEventKind.SWITCH: "switched_in",
+        }),
+        (SubscriptionEvents.from_offer_id, {
+            SubscriptionEventKind.SWITCH: "switched_out",
+            SubscriptionEventKind.UNSUBSCRIBE: "unsubscribed",
+        }),
+    ]
+    for offer_column, fields in directions:
+        statement = (
+            select(day, SubscriptionEvents.kind, func.count())
+            .where(offer_column == offer_id, SubscriptionEvents.created_at >= since)
+            .group_by(day, SubscriptionEvents.kind)
+        )
+        for event_day, kind, count in (await session.exec(statement)).all():
+            if kind not in fields:
+                continue
+            flow = flows.setdefault(str(event_day), OfferDailyFlow(day=event_day))
+            setattr(flow, fields[kind], count)
+
+    return [flows[event_day] for event_day in sorted(flows)]
@@ -0,0 +1,89 @@
+"""Access rules
+
+A user's subscription state relative to a target offer is exactly one of:
+FIRST (no current nor previous offer), RENEW (a previous offer but no
+current one), SWITCH (currently on another offer) or SAME (already on the
+target offer). Each access type allows one state, and an offer without
+access rules allows all of them.
+
+AccessRuleTable compiles the rules of every offer into a bitmask of allowed
+states when the catalog loads, so checking eligibility is a bitwise AND.
+"""
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from ..models.offers import AccessType, Offers
+
+FIRST_SUB = 1
+RENEW_SUB = 2
+SWITCH_SUB = 4
+SAME_OFFER = 8
+ALL_STATES = FIRST_SUB | RENEW_SUB | SWITCH_SUB | SAME_OFFER
+
+ACCESS_TYPE_STATES = {
+    AccessType.FIRST_SUB: FIRST_SUB,
+    AccessType.RENEW_SUB: RENEW_SUB,
+    AccessType.SWITCH_SUB: SWITCH_SUB,
+}
+
+
+def user_state(offer_id: int, user_offer_id: Optional[int], user_previous_offer_id: Optional[int]) -> int:
+    """State bit of a user relative to the offer `offer_id`"""
+    if user_offer_id is None:
+        return FIRST_SUB if user_previous_offer_id is None else RENEW_SUB
+    return SAME_OFFER if user_offer_id == offer_id else SWITCH_SUB
+
+
+def compile_access_mask(offer: Offers) -> int:
+    """Bitmask of the user states allowed to subscribe to `offer`"""
+    # If no access rules, the offer is accessible to everyone
+    if not offer.access_rules:
+        return ALL_STATES
+    mask = 0
+    for rule in offer.access_rules:
+        mask |= ACCESS_TYPE_STATES.get(rule.access_type, 0)
+    return mask
+
+
+class AccessRuleTable:
+    """Compiled access rules of every offer of the catalog"""
+
+    def __init__(self, offers: Iterable[Offers]):
+        self.masks: Dict[int, int] = {offer.id: compile_access_mask(offer) for offer in offers}
+        self._ordered_ids = sorted(self.masks)
+        # Offers allowed to users without a current offer depend on the state only
+        self._by_state = {
+            state: [offer_id for offer_id in self._ordered_ids if self.masks[offer_id] & state]
+            for state in (FIRST_SUB, RENEW_SUB)
+        }
+
+    def is_accessible(
+        self, offer_id: int, user_offer_id: Optional[int], user_previous_offer_id: Optional[int]
+    ) -> bool:
+        """Check if an offer is accessible to a user in the given state"""
+        return bool(self.masks.get(offer_id, 0) & user_state(offer_id, user_offer_id, user_previous_offer_id))
+
+    def eligible_offer_ids(self, user_offer_id: Optional[int], user_previous_offer_id: Optional[int]) -> List[int]:
+        """Ids of every offer a user in the given state may subscribe to"""
+        if user_offer_id is None:
+            return self._by_state[FIRST_SUB if user_previous_offer_id is None else RENEW_SUB]
+        return [
+            offer_id for offer_id in self._ordered_ids
+            if self.masks[offer_id] & (SAME_OFFER if offer_id == user_offer_id else SWITCH_SUB)
+        ]
+
+    def eligible_offer_ids_many(
+        self, states: Iterable[Tuple[int, Optional[int], Optional[int]]]
+    ) -> Dict[int, List[int]]:
+        """Eligible offers of many users given (user_id, offer_id, previous_offer_id) rows
+
+        Users sharing a state share the result, which is computed once per
+        distinct state instead of once per user.
+        """
+        by_state: Dict[Hashable, List[int]] = {}
+        eligible = {}
+        for user_id, user_offer_id, user_previous_offer_id in states:
+            key = user_offer_id if user_offer_id is not None else (user_previous_offer_id is None,)
+            if key not in by_state:
+                by_state[key] = self.eligible_offer_ids(user_offer_id, user_previous_offer_id)
+            eligible[user_id] = by_state[key]
+        return eligible
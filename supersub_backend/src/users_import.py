@@ -0,0 +1,165 @@
+"""Bulk import of users from CSV or NDJSON files
+
+Rows are processed in chunks. Each chunk is validated against UsersCreate,
+checked for existing emails with a single query, hashed in parallel across
+the process pool and written with one multi-row
+INSERT ... ON CONFLICT (email) DO NOTHING. Rejected rows are reported
+individually instead of failing the whole import.
+
+Command line usage:
+
+    python -m src.users_import users.csv
+    python -m src.users_import users.ndjson --format ndjson
+"""
+import argparse
+import asyncio
+import csv
+import json
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+
+from .auth.hashing import hash_passwords, shutdown_executor
+from .database import engine, session_scope
+from .models.users import Users, UsersCreate, UsersFileFormat, UsersImportError, UsersImportReport
+
+# 4000 rows x 7 columns stays below the bind parameter limits of Postgres and SQLite
+IMPORT_CHUNK_SIZE = 4000
+MAX_REPORTED_ERRORS = 1000
+
+
+def parse_rows(lines: Iterable[str], format: UsersFileFormat) -> Iterator[Tuple[int, Any]]:
+    """Yield (row number, raw row) pairs; NDJSON lines are decoded later, per row"""
+    if format == UsersFileFormat.CSV:
+        yield from enumerate(csv.DictReader(lines), start=1)
+    else:
+        yield from enumerate((line for line in lines if line.strip()), start=1)
+
+
+def _read_chunk(rows: Iterator[Tuple[int, Any]]) -> List[Tuple[int, Any]]:
+    return list(islice(rows, IMPORT_CHUNK_SIZE))
+
+
+def _reject(errors: List[UsersImportError], row: int, email: Any, detail: str) -> None:
+    errors.append(UsersImportError(
+        row=row,
+        email=email if isinstance(email, str) else None,
+        detail=detail
+    ))
+
+
+def _report_errors(report: UsersImportReport, errors: List[UsersImportError]) -> None:
+    """Count the rows rejected in a chunk and report them in row order"""
+    report.failed += len(errors)
+    errors.sort(key=lambda error: error.row)
+    report.errors.extend(errors[:max(0, MAX_REPORTED_ERRORS - len(report.errors))])
+
+
+def _validate(
+    chunk: List[Tuple[int, Any]], seen: Set[str], errors: List[UsersImportError]
+) -> List[Tuple[int, UsersCreate]]:
+    valid = []
+    for number, raw in chunk:
+        data = raw
+        try:
+            if isinstance(raw, str):
+                data = json.loads(raw)
+            user = UsersCreate.model_validate(data)
+        except ValidationError as e:
+            detail = "; ".join(
+                ": ".join(filter(None, [".".join(map(str, error["loc"])), error["msg"]])) for error in e.errors()
+            )
+            _reject(errors, number, data.get("email") if isinstance(data, dict) else None, detail)
+            continue
+        except ValueError as e:
+            _reject(errors, number, None, f"Invalid JSON: {e}")
+            continue
+
+        if user.email in seen:
+            _reject(errors, number, user.email, "Email duplicated in the file")
+            continue
+        seen.add(user.email)
+        valid.append((number, user))
+    return valid
+
+
+async def _insert_users(valid: List[Tuple[int, UsersCreate]], errors: List[UsersImportError]) -> int:
+    """Insert the validated rows whose email is not registered yet, return how many were"""
+    async with session_scope() as session:
+        # One set-based query for the whole chunk
+        emails = [user.email for _, user in valid]
+        existing = set((await session.exec(select(Users.email).where(Users.email.in_(emails)))).all())
+        for number, user in valid:
+            if user.email in existing:
+                _reject(errors, number, user.email, "Email already registered")
+        new_users = [(number, user) for number, user in valid if user.email not in existing]
+        if not new_users:
+            return 0
+
+        hashed = await hash_passwords([user.password for _, user in new_users])
+        values = [
+            {**user.model_dump(), "password": password_hash}
+            for (_, user), password_hash in zip(new_users, hashed)
+        ]
+        insert = sqlite.insert if engine.dialect.name == "sqlite" else postgresql.insert
+        statement = (
+            insert(Users)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=["email"])
+            .returning(Users.email)
+        )
+        inserted = set((await session.execute(statement)).scalars().all())
+        await session.commit()
+
+    for number, user in new_users:
+        if user.email not in inserted:
+            # Registered concurrently since the existence check
+            _reject(errors, number, user.email, "Email already registered")
+    return len(inserted)
+
+
+async def _import_chunk(chunk: List[Tuple[int, Any]], seen: Set[str], report: UsersImportReport) -> None:
+    report.total += len(chunk)
+    errors: List[UsersImportError] = []
+    valid = await run_in_threadpool(_validate, chunk, seen, errors)
+    if valid:
+        report.imported += await _insert_users(valid, errors)
+    _report_errors(report, errors)
+
+
+async def import_users(rows: Iterable[Tuple[int, Any]]) -> UsersImportReport:
+    """Import parsed rows chunk by chunk and report rejected rows"""
+    report = UsersImportReport()
+    seen: Set[str] = set()
+    rows = iter(rows)
+    # Reading the file (possibly spooled to disk) and validating rows block:
+    # both run in the threadpool, chunk by chunk, so the event loop only awaits
+    while chunk := await run_in_threadpool(_read_chunk, rows):
+        await _import_chunk(chunk, seen, report)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk import users from a CSV or NDJSON file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=[f.value for f in UsersFileFormat], default=None,
+                        help="File format (default: guessed from the extension)")
+    args = parser.parse_args()
+
+    format = UsersFileFormat(args.format) if args.format else (
+        UsersFileFormat.CSV if args.path.endswith(".csv") else UsersFileFormat.NDJSON
+    )
+    try:
+        with open(args.path, encoding="utf-8", newline="") as lines:
+            report = asyncio.run(import_users(parse_rows(lines, format)))
+    finally:
+        shutdown_executor()
+    print(report.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()